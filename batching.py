@@ -0,0 +1,57 @@
+# batching.py
+
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+def plan_token_batches(
+    lengths: List[int],
+    max_tokens: int,
+    max_batch_size: Optional[int] = None,
+) -> List[List[int]]:
+    """
+    Group item indices into batches under a padded-token budget.
+
+    Items are sorted by length (longest first, ties kept in input order) and
+    packed greedily so that len(batch) * longest_in_batch <= max_tokens.
+    An item longer than the budget on its own still gets its own batch.
+
+    Args:
+        lengths: token length of every item
+        max_tokens: maximum padded tokens per batch
+        max_batch_size: optional cap on rows per batch
+
+    Returns:
+        list of batches, each a list of indices into `lengths`
+    """
+    if max_tokens <= 0:
+        raise ValueError(f"max_tokens must be positive, got {max_tokens}")
+
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_max = 0
+    for i in order:
+        new_max = max(current_max, lengths[i])
+        too_many_tokens = new_max * (len(current) + 1) > max_tokens
+        too_many_rows = max_batch_size is not None and len(current) >= max_batch_size
+        if current and (too_many_tokens or too_many_rows):
+            batches.append(current)
+            current, new_max = [], lengths[i]
+        current.append(i)
+        current_max = new_max
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def dedup(items: List[Hashable]) -> Tuple[List[Hashable], List[int]]:
+    """
+    Unique items in first-seen order, plus for every input the position
+    of its value in that list, so `[unique[j] for j in inverse]` rebuilds
+    the input (and the same expands per-unique results back to it).
+    """
+    position: Dict[Hashable, int] = {}
+    inverse = [position.setdefault(item, len(position)) for item in items]
+    return list(position), inverse
@@ -1,40 +1,56 @@
 # build_typology_dataset.py
 
-import os
-from typing import List
+import argparse
+import hashlib
+from functools import partial
+from importlib import metadata
+from typing import Dict, List, Optional
 
-import torch
 import pandas as pd
 
 from config import LANG_CONFIG
+from embedding_cache import EmbeddingCache
+# count_* / type_token_ratio are re-exported for older callers
+from features import (
+    FEATURE_SCHEMA_VERSION,
+    build_feature_frame,
+    count_chars,
+    count_tokens,
+    type_token_ratio,
+)
 from metrics import (
-    COMET_MODEL,
+    COMET_MODEL_NAME,
+    COMET_TOLERANCE,
+    check_comet_tolerance,
     compute_bleu,
     compute_chrf,
-    compute_comet,
+    score_comet,
+)
+from mt_models import DECODING_MODES, DEFAULT_DECODING, cache_variant
+from storage import (
+    DATASET_DIR,
+    dataset_langs,
+    read_cache,
+    read_dataset,
+    read_manifest,
+    remove_dataset_partition,
+    write_dataset_partition,
+    write_manifest,
+)
+from token_cache import TokenCache
+from work_queue import (
+    DEFAULT_LEASE_SECONDS,
+    WorkQueue,
+    init_queue,
+    print_status,
+    run_worker,
+    shard_ranges,
 )
 
-CACHE_DIR = "cache"
-OUT_PATH = "data/typology_training_data.csv"
-
-os.makedirs("data", exist_ok=True)
-
-
-# ---------- basic surface features ----------
-
-def count_tokens(text: str) -> int:
-    return len(str(text).strip().split())
-
-
-def count_chars(text: str) -> int:
-    return len(str(text))
-
+OUT_DIR = DATASET_DIR
 
-def type_token_ratio(text: str) -> float:
-    tokens = str(text).strip().split()
-    if not tokens:
-        return 0.0
-    return len(set(tokens)) / len(tokens)
+# Job kind of one (language, shard) unit of sentence COMET in --queue-dir mode
+COMET_JOB = "comet"
 
 
 # ---------- COMET sentence-level helper ----------
@@ -48,157 +64,553 @@ def compute_sentence_comet(
 ) -> List[float]:
     """
     Return a list of per-sentence COMET scores aligned with src/mt/ref.
-    Uses the already-loaded COMET_MODEL from metrics.py.
+    Thin wrapper over metrics.score_comet, kept for existing callers.
     """
-    assert len(src) == len(mt) == len(ref)
+    return score_comet(
+        src, mt, ref, batch_size=batch_size, use_gpu=use_gpu
+    )["scores"]
 
-    data = [{"src": s, "mt": m, "ref": r} for s, m, r in zip(src, mt, ref)]
 
-    result = COMET_MODEL.predict(
-        data,
-        batch_size=batch_size,
-        gpus=1 if use_gpu else 0,
-        num_workers=1,
+def _comet_engine_kwargs(
+    src: List[str],
+    mt: List[str],
+    ref: List[str],
+    use_gpu: bool,
+    comet_engine: str,
+    comet_quantize: bool,
+    comet_workers: int,
+    check_comet: bool,
+) -> Dict[str, object]:
+    """score_comet kwargs for a non-reference engine, checked against the reference if asked."""
+    if comet_engine == "reference":
+        return {}
+    comet_kwargs = dict(
+        engine=comet_engine, quantize=comet_quantize, num_workers=comet_workers
     )
+    if check_comet:
+        check = check_comet_tolerance(
+            src[:64], mt[:64], ref[:64], use_gpu=use_gpu, **comet_kwargs
+        )
+        print(f"[INFO] COMET {comet_engine} engine vs reference: {check}")
+        if not check["ok"]:
+            raise ValueError(
+                f"COMET {comet_engine} engine drifted by {check['max_abs_delta']:.4f} "
+                f"(> {COMET_TOLERANCE}) from the reference implementation."
+            )
+    return comet_kwargs
+
+
+# ---------- main dataset builder ----------
 
-    # Handle different COMET return formats
-    if hasattr(result, "scores"):
-        seg_scores = result.scores
-    elif isinstance(result, dict):
-        seg_scores = (
-            result.get("scores")
-            or result.get("segments_scores")
-            or result.get("sentence_scores")
+def build_language_frame(
+    lang_code: str,
+    df: pd.DataFrame,
+    use_gpu: bool = False,
+    comet_engine: str = "reference",
+    comet_quantize: bool = False,
+    comet_workers: int = 1,
+    check_comet: bool = False,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    token_cache: Optional[TokenCache] = None,
+    comet_scores: Optional[List[float]] = None,
+) -> pd.DataFrame:
+    """
+    Sentence-level features + COMET + corpus-level BLEU/chrF/COMET for one
+    language's cached src/ref/mt.
+
+    comet_engine / comet_quantize / comet_workers select the COMET path (see
+    metrics.score_comet). With the "fast" engine and check_comet=True, the
+    first 64 sentences are also scored with the reference implementation,
+    and we abort if any score drifts beyond COMET_TOLERANCE.
+    embedding_cache (fast engine only) lets reruns skip sentences that were
+    already encoded; token_cache (fast engine only) skips re-tokenizing the
+    ones that still need encoding.
+    comet_scores: sentence COMET already computed for df's rows (e.g. by
+    queue workers); COMET is then not run here.
+    """
+    cfg = LANG_CONFIG[lang_code]
+    pair = cfg["pair"]       # e.g. "en-tr"
+    typology = cfg["typology"]
+
+    df = df.dropna(subset=["src", "ref", "mt"])
+
+    src_list = df["src"].astype(str).tolist()
+    ref_list = df["ref"].astype(str).tolist()
+    mt_list  = df["mt"].astype(str).tolist()
+
+    # --- Corpus-level metrics for this language ---
+    print(f"[INFO] Computing corpus BLEU/chrF for {lang_code}")
+    bleu_corpus = compute_bleu(mt_list, ref_list)
+    chrf_corpus = compute_chrf(mt_list, ref_list)
+
+    # --- COMET: one pass gives both sentence and corpus scores ---
+    if comet_scores is not None:
+        if len(comet_scores) != len(src_list):
+            raise ValueError(
+                f"{len(comet_scores)} COMET scores for {len(src_list)} sentences of {lang_code}."
+            )
+        comet_sentence_scores = [float(x) for x in comet_scores]
+        # COMET's system score is the mean of its segment scores
+        comet_corpus = (
+            sum(comet_sentence_scores) / len(comet_sentence_scores)
+            if comet_sentence_scores else float("nan")
         )
-        if seg_scores is None:
-            raise ValueError("COMET result dict has no sentence-level scores.")
     else:
-        seg_scores, _ = result
-
-    if len(seg_scores) != len(src):
-        raise ValueError(
-            f"COMET returned {len(seg_scores)} scores for {len(src)} sentences."
+        comet_kwargs = _comet_engine_kwargs(
+            src_list, mt_list, ref_list, use_gpu,
+            comet_engine, comet_quantize, comet_workers, check_comet,
         )
+        if comet_engine != "reference":
+            comet_kwargs["embedding_cache"] = embedding_cache
+            comet_kwargs["token_cache"] = token_cache
 
-    return [float(s) for s in seg_scores]
+        print(f"[INFO] Computing COMET for {lang_code}")
+        comet = score_comet(
+            src_list,
+            mt_list,
+            ref_list,
+            batch_size=16,
+            use_gpu=use_gpu,
+            **comet_kwargs,
+        )
+        comet_corpus = comet["system_score"]
+        comet_sentence_scores = comet["scores"]
+        print(
+            f"[INFO] COMET for {lang_code} took {comet['seconds']:.1f}s "
+            f"({comet['n_deduplicated']} duplicate triples scored once)"
+        )
 
+    # --- Build rows ---
+    feats = build_feature_frame(
+        src_list,
+        ref_list,
+        mt_list,
+        comet_sentence_scores,
+        bleu_corpus,
+        chrf_corpus,
+        comet_corpus,
+    )
+    meta = pd.DataFrame({
+        "lang": lang_code,
+        "pair": pair,
+        "typology": typology,
+        "src": src_list,
+        "ref": ref_list,
+        "mt": mt_list,
+    })
+    return pd.concat([meta, feats], axis=1)
 
-# ---------- main dataset builder ----------
 
 def build_dataset(
     max_samples: int = 500,
     split: str = "train",
+    root: str = OUT_DIR,
+    **kwargs,
 ) -> pd.DataFrame:
     """
-    Loop over languages in LANG_CONFIG, read cached MT CSVs,
-    compute sentence-level features + COMET + corpus-level BLEU/chrF/COMET,
-    and return a single big DataFrame.
+    Bring the dataset under root up to date (build_incremental, same
+    keyword arguments) and return all of it as one DataFrame.
     """
-    rows = []
+    build_incremental(max_samples=max_samples, split=split, root=root, **kwargs)
+    return read_dataset(root=root)
+
+
+# ---------- incremental builds ----------
+
+def _package_version(name: str) -> Optional[str]:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def content_hash(df: pd.DataFrame) -> str:
+    """sha256 over the src/ref/mt text of a translation cache, row by row."""
+    h = hashlib.sha256()
+    for col in ("src", "ref", "mt"):
+        for text in df[col].astype(str):
+            h.update(text.encode("utf-8"))
+            h.update(b"\0")
+        h.update(b"\1")
+    return h.hexdigest()
+
+
+def language_fingerprint(
+    lang_code: str,
+    df: pd.DataFrame,
+    max_samples: int,
+    split: str,
+    comet_engine: str = "reference",
+    comet_quantize: bool = False,
+) -> Dict[str, object]:
+    """
+    Everything a language's partition depends on. A partition whose manifest
+    entry differs from this is stale and gets rebuilt.
+    """
+    return {
+        "content_hash": content_hash(df),
+        "n_rows": len(df),
+        "pair": LANG_CONFIG[lang_code]["pair"],
+        "typology": LANG_CONFIG[lang_code]["typology"],
+        "max_samples": max_samples,
+        "split": split,
+        "comet_model": COMET_MODEL_NAME,
+        "comet_engine": comet_engine,
+        "comet_int8": comet_quantize,
+        "comet_version": _package_version("unbabel-comet"),
+        "sacrebleu_version": _package_version("sacrebleu"),
+        "feature_schema_version": FEATURE_SCHEMA_VERSION,
+    }
+
+
+def _languages_to_keep(present: List[str], prune_missing: bool) -> List[str]:
+    """
+    Languages prune_dataset must keep: all of LANG_CONFIG, or with
+    prune_missing only those whose translation cache was found (present).
+    """
+    return list(present) if prune_missing else list(LANG_CONFIG)
 
-    use_gpu = torch.cuda.is_available()
-    print(f"[INFO] Using GPU for COMET: {use_gpu}")
 
-    for lang_code, cfg in LANG_CONFIG.items():
-        pair = cfg["pair"]       # e.g. "en-tr"
-        typology = cfg["typology"]
+def _warn_missing_cache(lang_code: str, pair: str, max_samples: int, split: str,
+                        existing: set, prune_missing: bool):
+    print(f"[WARN] Cache not found for {pair} ({max_samples=}, {split=}) – skipping.")
+    if lang_code in existing:
+        if prune_missing:
+            print(f"[WARN] {lang_code}: its partition will be removed (--prune)")
+        else:
+            print(f"[WARN] {lang_code}: keeping its existing partition (--prune would remove it)")
 
-        cache_path = os.path.join(CACHE_DIR, f"{pair}_n{max_samples}_{split}.csv")
-        if not os.path.exists(cache_path):
-            print(f"[WARN] Cache not found for {pair} at {cache_path} – skipping.")
-            continue
 
-        print(f"[INFO] Loading cache for {lang_code} ({pair}) from {cache_path}")
-        df = pd.read_csv(cache_path).dropna(subset=["src", "ref", "mt"])
+def prune_dataset(keep: List[str], root: str = OUT_DIR) -> List[str]:
+    """
+    Drop the partitions and manifest entries of languages not in keep, so
+    read_dataset() stops returning them. Returns the removed languages.
+    """
+    manifest = read_manifest(root)
+    stale = sorted((set(dataset_langs(root)) | set(manifest)) - set(keep))
+    for lang_code in stale:
+        print(f"[INFO] Removing {lang_code} from {root}/")
+        remove_dataset_partition(lang_code, root)
+        manifest.pop(lang_code, None)
+    if stale:
+        write_manifest(manifest, root)
+    return stale
+
+
+def build_incremental(
+    max_samples: int = 500,
+    split: str = "train",
+    decoding: str = DEFAULT_DECODING,
+    root: str = OUT_DIR,
+    force: bool = False,
+    prune_missing: bool = False,
+    comet_engine: str = "reference",
+    comet_quantize: bool = False,
+    comet_workers: int = 1,
+    check_comet: bool = True,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    token_cache: Optional[TokenCache] = None,
+) -> List[str]:
+    """
+    Bring the Parquet dataset under root up to date with the translation caches.
+
+    Each language's partition is recorded in root/manifest.json with its
+    language_fingerprint(). Only languages whose fingerprint changed (new
+    language, changed cache, other COMET setup, new FEATURE_SCHEMA_VERSION,
+    ...) or whose partition is missing are recomputed; the others are left
+    as they are. The manifest is updated after every language, so an
+    interrupted build keeps what it finished. Languages no longer in
+    LANG_CONFIG are pruned at the end (prune_dataset); a language whose
+    cache is missing keeps its partition unless prune_missing is set.
+    Returns the rebuilt languages.
+
+    decoding selects which run_language_eval --decoding caches are read.
+    """
+    import torch
+
+    use_gpu = torch.cuda.is_available()
+    manifest = read_manifest(root)
+    existing = set(dataset_langs(root))
 
-        src_list = df["src"].astype(str).tolist()
-        ref_list = df["ref"].astype(str).tolist()
-        mt_list  = df["mt"].astype(str).tolist()
+    rebuilt, present = [], []
+    for lang_code, cfg in LANG_CONFIG.items():
+        pair = cfg["pair"]
+        df = read_cache(lang_code, pair, max_samples, split, cache_variant(decoding=decoding))
+        if df is None:
+            _warn_missing_cache(lang_code, pair, max_samples, split, existing, prune_missing)
+            continue
+        present.append(lang_code)
 
-        # --- Corpus-level metrics for this language ---
-        print(f"[INFO] Computing corpus BLEU/chrF/COMET for {lang_code}")
-        bleu_corpus = compute_bleu(mt_list, ref_list)
-        chrf_corpus = compute_chrf(mt_list, ref_list)
-        comet_corpus = compute_comet(
-            src_list,
-            mt_list,
-            ref_list,
-            batch_size=16,
-            use_gpu=use_gpu,
+        fingerprint = language_fingerprint(
+            lang_code, df, max_samples, split, comet_engine, comet_quantize
         )
+        if not force and lang_code in existing and manifest.get(lang_code) == fingerprint:
+            print(f"[INFO] {lang_code} is up to date")
+            continue
 
-        # --- Sentence-level COMET ---
-        print(f"[INFO] Computing sentence-level COMET for {lang_code}")
-        comet_sentence_scores = compute_sentence_comet(
-            src_list,
-            mt_list,
-            ref_list,
-            batch_size=16,
+        print(f"[INFO] Rebuilding {lang_code} ({pair})")
+        part = build_language_frame(
+            lang_code,
+            df,
             use_gpu=use_gpu,
+            comet_engine=comet_engine,
+            comet_quantize=comet_quantize,
+            comet_workers=comet_workers,
+            check_comet=check_comet,
+            embedding_cache=embedding_cache,
+            token_cache=token_cache,
         )
+        check_comet = False
+
+        write_dataset_partition(part, lang_code, root=root)
+        manifest[lang_code] = fingerprint
+        write_manifest(manifest, root)
+        rebuilt.append(lang_code)
 
-        # --- Build rows ---
-        for src, ref, mt, comet_sentence in zip(
-            src_list, ref_list, mt_list, comet_sentence_scores
-        ):
-            src_tok = count_tokens(src)
-            ref_tok = count_tokens(ref)
-            mt_tok  = count_tokens(mt)
+    prune_dataset(_languages_to_keep(present, prune_missing), root)
+    return rebuilt
 
-            src_char = count_chars(src)
-            ref_char = count_chars(ref)
-            mt_char  = count_chars(mt)
 
-            len_ratio_mt_src  = mt_tok  / src_tok if src_tok > 0 else 0.0
-            len_ratio_ref_src = ref_tok / src_tok if src_tok > 0 else 0.0
+# ---------- multi-node work queue ----------
 
-            src_cpt = src_char / src_tok if src_tok > 0 else 0.0
-            ref_cpt = ref_char / ref_tok if ref_tok > 0 else 0.0
-            mt_cpt  = mt_char / mt_tok  if mt_tok  > 0 else 0.0
+def _input_job_id(lang_code: str) -> str:
+    return f"input-{lang_code}"
 
-            src_ttr = type_token_ratio(src)
-            ref_ttr = type_token_ratio(ref)
-            mt_ttr  = type_token_ratio(mt)
 
-            rows.append({
+def init_build_queue(
+    queue: WorkQueue,
+    max_samples: int = 500,
+    split: str = "train",
+    decoding: str = DEFAULT_DECODING,
+    root: str = OUT_DIR,
+    force: bool = False,
+    prune_missing: bool = False,
+    shard_size: int = 250,
+    comet_engine: str = "reference",
+    comet_quantize: bool = False,
+    comet_workers: int = 1,
+    check_comet: bool = True,
+) -> List[str]:
+    """
+    Enqueue sentence-COMET jobs for every stale language (as in
+    build_incremental), one per shard of shard_size sentences. Each
+    language's cleaned translation cache is copied into the queue
+    directory, so workers need no local caches. The languages merge_build_queue
+    keeps are fixed here (see build_incremental for prune_missing). Returns
+    the queued languages.
+    """
+    manifest = read_manifest(root)
+    existing = set(dataset_langs(root))
+
+    langs, present, fingerprints, jobs = [], [], {}, []
+    for lang_code, cfg in LANG_CONFIG.items():
+        pair = cfg["pair"]
+        df = read_cache(lang_code, pair, max_samples, split, cache_variant(decoding=decoding))
+        if df is None:
+            _warn_missing_cache(lang_code, pair, max_samples, split, existing, prune_missing)
+            continue
+        present.append(lang_code)
+
+        fingerprint = language_fingerprint(
+            lang_code, df, max_samples, split, comet_engine, comet_quantize
+        )
+        if not force and lang_code in existing and manifest.get(lang_code) == fingerprint:
+            print(f"[INFO] {lang_code} is up to date")
+            continue
+
+        df = df.dropna(subset=["src", "ref", "mt"])[["src", "ref", "mt"]].astype(str)
+        if check_comet:
+            # Checked once here, so workers do not each repeat it
+            _comet_engine_kwargs(
+                df["src"].tolist(), df["mt"].tolist(), df["ref"].tolist(), False,
+                comet_engine, comet_quantize, comet_workers, check_comet,
+            )
+            check_comet = False
+        queue.write_frame(_input_job_id(lang_code), df)
+
+        langs.append(lang_code)
+        fingerprints[lang_code] = fingerprint
+        for shard, (start, stop) in enumerate(shard_ranges(len(df), shard_size)):
+            payload = {
                 "lang": lang_code,
-                "pair": pair,
-                "typology": typology,
-                "src": src,
-                "ref": ref,
-                "mt": mt,
-                # surface features
-                "src_len_tokens": src_tok,
-                "ref_len_tokens": ref_tok,
-                "mt_len_tokens": mt_tok,
-                "src_len_chars": src_char,
-                "ref_len_chars": ref_char,
-                "mt_len_chars": mt_char,
-                "len_ratio_mt_src": len_ratio_mt_src,
-                "len_ratio_ref_src": len_ratio_ref_src,
-                "src_chars_per_token": src_cpt,
-                "ref_chars_per_token": ref_cpt,
-                "mt_chars_per_token": mt_cpt,
-                "src_ttr": src_ttr,
-                "ref_ttr": ref_ttr,
-                "mt_ttr": mt_ttr,
-                # sentence-level COMET
-                "comet_sentence": comet_sentence,
-                # corpus-level metrics (same for all sentences for this language)
-                "bleu_corpus": bleu_corpus,
-                "chrf_corpus": chrf_corpus,
-                "comet_corpus": comet_corpus,
-            })
-
-    big_df = pd.DataFrame(rows)
-    print(f"[INFO] Built dataset with shape {big_df.shape}")
-    return big_df
+                "shard": shard,
+                "start": start,
+                "stop": stop,
+                "comet_engine": comet_engine,
+                "comet_int8": comet_quantize,
+                "comet_workers": comet_workers,
+            }
+            jobs.append((f"{COMET_JOB}-{lang_code}-{shard:05d}", COMET_JOB, payload))
+
+    config = {
+        "langs": langs,
+        "keep": _languages_to_keep(present, prune_missing),
+        "fingerprints": fingerprints,
+        "root": root,
+        "shard_size": shard_size,
+    }
+    init_queue(queue, config, jobs)
+    return langs
+
+
+def run_comet_shard(
+    queue: WorkQueue,
+    payload: dict,
+    job_id: str,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    token_cache: Optional[TokenCache] = None,
+) -> dict:
+    """Sentence COMET for one shard of a queued language, written to the queue's result_dir."""
+    import torch
+
+    use_gpu = torch.cuda.is_available()
+    df = pd.read_parquet(queue.result_path(_input_job_id(payload["lang"])))
+    df = df.iloc[payload["start"]: payload["stop"]]
+
+    comet_kwargs = {}
+    if payload["comet_engine"] != "reference":
+        comet_kwargs = dict(
+            engine=payload["comet_engine"],
+            quantize=payload["comet_int8"],
+            num_workers=payload["comet_workers"],
+            embedding_cache=embedding_cache,
+            token_cache=token_cache,
+        )
+    scores = score_comet(
+        df["src"].tolist(),
+        df["mt"].tolist(),
+        df["ref"].tolist(),
+        batch_size=16,
+        use_gpu=use_gpu,
+        **comet_kwargs,
+    )["scores"]
+
+    queue.write_frame(job_id, pd.DataFrame({"comet": scores}, columns=["comet"]))
+    return {"n_rows": len(scores)}
+
+
+def merge_build_queue(queue: WorkQueue) -> List[str]:
+    """
+    Once every shard is done: per queued language, concatenate its shard
+    scores in shard order, build its partition from them and record its
+    fingerprint in the manifest, then prune the languages not kept at init.
+    Returns the merged languages.
+    """
+    config = queue.get_meta("config")
+    queue.require_done(COMET_JOB)
+
+    root = config["root"]
+    manifest = read_manifest(root)
+    for lang_code in config["langs"]:
+        df = pd.read_parquet(queue.result_path(_input_job_id(lang_code)))
+        scores = queue.read_shards(COMET_JOB, lang_code)["comet"].tolist()
+
+        part = build_language_frame(lang_code, df, comet_scores=scores)
+        write_dataset_partition(part, lang_code, root=root)
+        manifest[lang_code] = config["fingerprints"][lang_code]
+        write_manifest(manifest, root)
+        print(f"[INFO] Merged {lang_code} into {root}/")
+
+    prune_dataset(config["keep"], root)
+    return config["langs"]
+
+
+def _queue_main(args):
+    queue = WorkQueue(args.queue_dir)
+    if args.role == "init":
+        init_build_queue(
+            queue,
+            max_samples=500,
+            split="train",
+            decoding=args.decoding,
+            root=OUT_DIR,
+            force=args.force,
+            prune_missing=args.prune,
+            shard_size=args.shard_size,
+            comet_engine=args.comet_engine,
+            comet_quantize=args.comet_int8,
+            comet_workers=args.comet_workers,
+            check_comet=not args.skip_comet_check,
+        )
+    elif args.role == "work":
+        # The engine comes with each job; the caches are only used by the fast one
+        handler = partial(
+            run_comet_shard,
+            queue,
+            embedding_cache=None if args.no_embedding_cache else EmbeddingCache(),
+            token_cache=None if args.no_token_cache else TokenCache(),
+        )
+        run_worker(queue, {COMET_JOB: handler}, lease_seconds=args.lease_seconds)
+    elif args.role == "merge":
+        merged = merge_build_queue(queue)
+        print(f"[INFO] Merged {len(merged)} language(s) {merged}")
+    print_status(queue)
+    queue.close()
 
 
 def main():
-    df = build_dataset(max_samples=500, split="train")
-    df.to_csv(OUT_PATH, index=False)
-    print(f"[INFO] Saved typology training data to {OUT_PATH}")
+    parser = argparse.ArgumentParser(description="Build the typology training dataset.")
+    parser.add_argument("--comet-engine", default="reference", choices=["reference", "fast"])
+    parser.add_argument("--comet-int8", action="store_true",
+                        help="int8-quantized COMET encoder (fast engine, CPU only)")
+    parser.add_argument("--comet-workers", type=int, default=1,
+                        help="tokenization threads for the fast COMET engine")
+    parser.add_argument("--skip-comet-check", action="store_true",
+                        help="do not compare the fast engine against the reference first")
+    parser.add_argument("--no-embedding-cache", action="store_true",
+                        help="fast engine: do not read/write cache/comet_embeddings.sqlite")
+    parser.add_argument("--no-token-cache", action="store_true",
+                        help="fast engine: do not read/write cache/tokens/")
+    parser.add_argument("--decoding", default=DEFAULT_DECODING, choices=DECODING_MODES,
+                        help="which run_language_eval --decoding caches to read")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every language, even if its manifest entry is current")
+    parser.add_argument("--prune", action="store_true",
+                        help="also delete the partitions of languages whose translation cache "
+                             "is missing (by default they are kept with a warning)")
+    parser.add_argument("--queue-dir", default=None,
+                        help="shared directory of a multi-node build (see --role); "
+                             "the COMET settings are taken from --role init")
+    parser.add_argument("--role", choices=["init", "work", "merge", "status"], default="status",
+                        help="with --queue-dir: init enqueues (language, shard) COMET jobs for "
+                             "stale languages, work runs them until the queue is drained "
+                             "(start any number, on any node), merge writes the partitions")
+    parser.add_argument("--shard-size", type=int, default=250,
+                        help="sentences per queued job")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="a job whose worker has not sent a heartbeat for this long is "
+                             "handed to another worker")
+    args = parser.parse_args()
+
+    if args.queue_dir:
+        _queue_main(args)
+        return
+
+    embedding_cache = None
+    if args.comet_engine == "fast" and not args.no_embedding_cache:
+        embedding_cache = EmbeddingCache()
+    token_cache = None
+    if args.comet_engine == "fast" and not args.no_token_cache:
+        token_cache = TokenCache()
+
+    rebuilt = build_incremental(
+        max_samples=500,
+        split="train",
+        decoding=args.decoding,
+        root=OUT_DIR,
+        force=args.force,
+        prune_missing=args.prune,
+        comet_engine=args.comet_engine,
+        comet_quantize=args.comet_int8,
+        comet_workers=args.comet_workers,
+        check_comet=not args.skip_comet_check,
+        embedding_cache=embedding_cache,
+        token_cache=token_cache,
+    )
+    print(
+        f"[INFO] Rebuilt {len(rebuilt)} language(s) {rebuilt}; "
+        f"typology training data is in {OUT_DIR}/ (Parquet, one partition per language)"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+# checkpoint.py
+
+import json
+import os
+from typing import Dict, Iterable, Tuple
+
+CHECKPOINT_DIR = "cache/checkpoints"
+
+
+class CheckpointLog:
+    """
+    Append-only JSON-lines log of (key, value) records.
+
+    Every append is flushed and fsynced, so whatever was written before a
+    crash / preemption / Ctrl-C is on disk; a torn last line is ignored on
+    load, and the next append starts on a fresh line after it. Later
+    records for the same key win.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+    def load(self) -> Dict[str, object]:
+        records: Dict[str, object] = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partially written line from an interrupted run
+                records[rec["key"]] = rec["value"]
+        return records
+
+    def _ends_with_newline(self) -> bool:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def append(self, items: Iterable[Tuple[str, object]]):
+        torn = not self._ends_with_newline()
+        with open(self.path, "a", encoding="utf-8") as f:
+            if torn:
+                # don't glue the first new record onto a partial line
+                f.write("\n")
+            for key, value in items:
+                f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
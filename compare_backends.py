@@ -0,0 +1,102 @@
+# compare_backends.py -- speed / quality drift of MT backends against fp32 PyTorch
+
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from config import LANG_CONFIG
+from metrics import compute_bleu, compute_chrf
+from mt_models import (
+    BACKENDS,
+    DECODING_MODES,
+    DEFAULT_DECODING,
+    DEFAULT_MAX_TOKENS,
+    MTTranslator,
+    cache_variant,
+    unload_m2m100,
+)
+from storage import read_cache
+
+OUT_PATH = "output/backend_comparison.csv"
+
+
+def compare_backends(
+    langs,
+    backends,
+    n_sentences: int = 100,
+    max_samples: int = 500,
+    split: str = "train",
+    decoding: str = DEFAULT_DECODING,
+) -> pd.DataFrame:
+    """
+    Re-translate the first n_sentences of each cached corpus with every
+    backend and report, per (language, backend):
+
+      - BLEU / chrF against the reference,
+      - drift: the same metrics minus those of the cached fp32 output,
+      - agreement: chrF of the backend output against the cached fp32 output,
+      - sentences per second (translation store disabled, so timings are real).
+
+    The fp32 reference is the cache run_language_eval wrote for `decoding`,
+    and every backend decodes with that same mode, so drift is backend-only.
+    """
+    rows = []
+    for backend in backends:
+        for lang in langs:
+            pair = LANG_CONFIG[lang]["pair"]
+            df = read_cache(lang, pair, max_samples, split, cache_variant("torch", decoding))
+            if df is None:
+                print(f"[WARN] No cached corpus for {lang} – skipping.")
+                continue
+            df = df.dropna(subset=["src", "ref", "mt"]).head(n_sentences)
+            src, ref, fp32_mt = (df[c].astype(str).tolist() for c in ("src", "ref", "mt"))
+
+            translator = MTTranslator(pair, device="cpu", backend=backend, decoding=decoding)
+            start = time.perf_counter()
+            mt = translator.translate_batch(src, batch_size=32, max_tokens=DEFAULT_MAX_TOKENS)
+            seconds = time.perf_counter() - start
+
+            bleu, chrf = compute_bleu(mt, ref), compute_chrf(mt, ref)
+            rows.append({
+                "language": lang,
+                "backend": backend,
+                "n_sentences": len(src),
+                "BLEU": bleu,
+                "chrF": chrf,
+                "BLEU_drift": bleu - compute_bleu(fp32_mt, ref),
+                "chrF_drift": chrf - compute_chrf(fp32_mt, ref),
+                "chrF_vs_fp32": compute_chrf(mt, fp32_mt),
+                "sents_per_sec": len(src) / seconds if seconds > 0 else float("nan"),
+            })
+        unload_m2m100(backend=backend)
+
+    df = pd.DataFrame(rows)
+    if len(df) and "torch" in backends:
+        base = df[df["backend"] == "torch"].set_index("language")["sents_per_sec"]
+        df["speedup_vs_torch"] = df["sents_per_sec"] / df["language"].map(base)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare MT backends against fp32 PyTorch.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"],
+                        choices=sorted(BACKENDS))
+    parser.add_argument("--langs", nargs="+", default=list(LANG_CONFIG.keys()))
+    parser.add_argument("--n", type=int, default=100, help="sentences per language")
+    parser.add_argument("--decoding", default=DEFAULT_DECODING, choices=DECODING_MODES,
+                        help="decoding mode of the cached fp32 run and of every backend")
+    parser.add_argument("--out", default=OUT_PATH)
+    args = parser.parse_args()
+
+    df = compare_backends(args.langs, args.backends, n_sentences=args.n, decoding=args.decoding)
+    print(df.groupby("backend")[["BLEU_drift", "chrF_drift", "chrF_vs_fp32", "sents_per_sec"]].mean())
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    df.to_csv(args.out, index=False)
+    print(f"[INFO] Saved per-language comparison to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# corpus_features.py -- per-language summary statistics of sentence features
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from features import SENTENCE_METRIC_COLS, SURFACE_FEATURE_COLS
+
+# Sentence-level columns that get summarised (corpus metrics are per-corpus already)
+AGGREGATED_SOURCE_COLS = SURFACE_FEATURE_COLS + SENTENCE_METRIC_COLS
+
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+# Histogram range per feature; values outside are clipped into the end bins
+_HIST_RANGES = {
+    "src_len_tokens": (0.0, 100.0),
+    "ref_len_tokens": (0.0, 100.0),
+    "mt_len_tokens": (0.0, 100.0),
+    "src_len_chars": (0.0, 600.0),
+    "ref_len_chars": (0.0, 600.0),
+    "mt_len_chars": (0.0, 600.0),
+    "len_ratio_mt_src": (0.0, 3.0),
+    "len_ratio_ref_src": (0.0, 3.0),
+    "src_chars_per_token": (0.0, 15.0),
+    "ref_chars_per_token": (0.0, 15.0),
+    "mt_chars_per_token": (0.0, 15.0),
+    "src_ttr": (0.0, 1.0),
+    "ref_ttr": (0.0, 1.0),
+    "mt_ttr": (0.0, 1.0),
+    "comet_sentence": (0.0, 1.0),
+}
+
+# Quantiles are read off FINE_BINS; the feature vector carries HIST_BINS of them
+FINE_BINS = 64
+HIST_BINS = 8
+
+
+def _aggregate_cols() -> List[str]:
+    cols = []
+    for c in AGGREGATED_SOURCE_COLS:
+        cols += [f"{c}_mean", f"{c}_std"]
+        cols += [f"{c}_q{int(q * 100)}" for q in QUANTILES]
+        cols += [f"{c}_hist{b}" for b in range(HIST_BINS)]
+    return cols + ["bleu_corpus", "chrf_corpus", "comet_corpus"]
+
+
+# What the corpus-level classifier is trained on and predicts from, in this order
+AGGREGATE_COLS = _aggregate_cols()
+
+
+class CorpusAggregator:
+    """
+    Streaming summary of a corpus' sentence features.
+
+    update() folds in any number of new sentences; the state is a count,
+    per-feature sums / sums of squares and a fixed-bin histogram per
+    feature, so memory does not grow with the corpus and two aggregators
+    can be merge()d. vector() turns the state into AGGREGATE_COLS:
+    mean, std, quantiles (interpolated from the histogram) and
+    normalised histogram bins per feature, plus the corpus metrics.
+
+    comet_corpus is the mean sentence COMET. BLEU/chrF are not
+    decomposable per sentence, so the caller passes the latest corpus
+    values to update().
+    """
+
+    def __init__(self):
+        k = len(AGGREGATED_SOURCE_COLS)
+        self.n = 0
+        self._sum = np.zeros(k)
+        self._sumsq = np.zeros(k)
+        self._hist = np.zeros((k, FINE_BINS), dtype=np.int64)
+        self._lo = np.array([_HIST_RANGES[c][0] for c in AGGREGATED_SOURCE_COLS])
+        self._hi = np.array([_HIST_RANGES[c][1] for c in AGGREGATED_SOURCE_COLS])
+        self.bleu_corpus = float("nan")
+        self.chrf_corpus = float("nan")
+
+    def update(
+        self,
+        features: pd.DataFrame,
+        bleu_corpus: Optional[float] = None,
+        chrf_corpus: Optional[float] = None,
+    ) -> "CorpusAggregator":
+        """Add sentence rows (needs AGGREGATED_SOURCE_COLS)."""
+        X = features[AGGREGATED_SOURCE_COLS].to_numpy(dtype=float)
+        X = X[~np.isnan(X).any(axis=1)]
+        if len(X):
+            self.n += len(X)
+            self._sum += X.sum(axis=0)
+            self._sumsq += (X * X).sum(axis=0)
+
+            scaled = (X - self._lo) / (self._hi - self._lo) * FINE_BINS
+            bins = np.clip(scaled.astype(int), 0, FINE_BINS - 1)
+            for j in range(X.shape[1]):
+                self._hist[j] += np.bincount(bins[:, j], minlength=FINE_BINS)
+
+        if bleu_corpus is not None:
+            self.bleu_corpus = float(bleu_corpus)
+        if chrf_corpus is not None:
+            self.chrf_corpus = float(chrf_corpus)
+        return self
+
+    def merge(self, other: "CorpusAggregator") -> "CorpusAggregator":
+        """Fold another aggregator's sentences into this one (corpus metrics: other wins if set)."""
+        self.n += other.n
+        self._sum += other._sum
+        self._sumsq += other._sumsq
+        self._hist += other._hist
+        if not np.isnan(other.bleu_corpus):
+            self.bleu_corpus = other.bleu_corpus
+        if not np.isnan(other.chrf_corpus):
+            self.chrf_corpus = other.chrf_corpus
+        return self
+
+    def _quantiles(self, j: int) -> List[float]:
+        counts = self._hist[j]
+        cum = np.cumsum(counts)
+        width = (self._hi[j] - self._lo[j]) / FINE_BINS
+        out = []
+        for q in QUANTILES:
+            # first bin whose cumulative count reaches q, interpolated within it
+            target = q * cum[-1]
+            b = int(np.searchsorted(cum, target, side="left"))
+            prev = cum[b - 1] if b else 0
+            frac = (target - prev) / counts[b] if counts[b] else 0.0
+            out.append(self._lo[j] + (b + frac) * width)
+        return out
+
+    def vector(self) -> Dict[str, float]:
+        """AGGREGATE_COLS -> value (NaN everywhere before the first update)."""
+        if self.n == 0:
+            return {c: float("nan") for c in AGGREGATE_COLS}
+
+        mean = self._sum / self.n
+        std = np.sqrt(np.maximum(self._sumsq / self.n - mean * mean, 0.0))
+        out: Dict[str, float] = {}
+        for j, c in enumerate(AGGREGATED_SOURCE_COLS):
+            out[f"{c}_mean"] = float(mean[j])
+            out[f"{c}_std"] = float(std[j])
+            for q, v in zip(QUANTILES, self._quantiles(j)):
+                out[f"{c}_q{int(q * 100)}"] = float(v)
+            coarse = self._hist[j].reshape(HIST_BINS, -1).sum(axis=1) / self.n
+            for b, v in enumerate(coarse):
+                out[f"{c}_hist{b}"] = float(v)
+
+        out["bleu_corpus"] = self.bleu_corpus
+        out["chrf_corpus"] = self.chrf_corpus
+        out["comet_corpus"] = out["comet_sentence_mean"]
+        return out
+
+    def frame(self) -> pd.DataFrame:
+        """vector() as a one-row DataFrame in AGGREGATE_COLS order."""
+        return pd.DataFrame([self.vector()], columns=AGGREGATE_COLS)
+
+
+def aggregate_dataset(df: pd.DataFrame, shards: int = 1, seed: int = 42) -> pd.DataFrame:
+    """
+    One row per language (per shard) of AGGREGATE_COLS, plus lang / typology.
+
+    df is the sentence-level dataset (read_dataset()): AGGREGATED_SOURCE_COLS,
+    bleu_corpus, chrf_corpus, lang, typology. With shards > 1 each
+    language's sentences are split at random into that many disjoint parts,
+    each aggregated on its own: more (smaller) training corpora per
+    language. BLEU/chrF stay those of the full corpus, since the dataset
+    keeps no per-shard values.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for lang, part in df.groupby("lang", sort=True):
+        order = rng.permutation(len(part))
+        for shard, idx in enumerate(np.array_split(order, shards)):
+            if not len(idx):
+                continue
+            agg = CorpusAggregator().update(
+                part.iloc[idx],
+                bleu_corpus=part["bleu_corpus"].iloc[0],
+                chrf_corpus=part["chrf_corpus"].iloc[0],
+            )
+            row = agg.vector()
+            row.update({
+                "lang": lang,
+                "typology": part["typology"].iloc[0],
+                "shard": shard,
+                "n_sentences": agg.n,
+            })
+            rows.append(row)
+    return pd.DataFrame(rows, columns=["lang", "typology", "shard", "n_sentences"] + AGGREGATE_COLS)
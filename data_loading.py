@@ -1,14 +1,71 @@
 # data_loading.py
 from datasets import load_dataset
 from typing import List, Tuple
+import heapq
 import random
 
 
+def sample_indices(
+    n: int,
+    max_samples: int,
+    seed: int = 42,
+    sampler: str = "python",
+) -> List[int]:
+    """
+    Pick up to max_samples row indices out of n, reproducibly for a seed.
+
+    For a fixed seed, the first k indices are the same for every
+    max_samples >= k, so a larger sample extends a smaller one.
+
+    sampler:
+        "python" -- seeded random.shuffle of range(n); identical to what
+                    earlier versions used, so existing cache/ files still
+                    match the sentences they were built from.
+        "numpy"  -- vectorized seeded permutation; much faster for
+                    million-row splits, but selects different sentences.
+    """
+    if sampler == "python":
+        indices = list(range(n))
+        random.Random(seed).shuffle(indices)
+        return indices[:max_samples]
+
+    if sampler == "numpy":
+        import numpy as np
+
+        perm = np.random.default_rng(seed).permutation(n)
+        return perm[:max_samples].tolist()
+
+    raise ValueError(f"Unknown sampler: {sampler!r} (expected 'python' or 'numpy')")
+
+
+def _reservoir_sample(rows, max_samples: int, seed: int) -> list:
+    """
+    Seeded sample of max_samples items from an iterable of unknown length,
+    in one pass and O(max_samples) memory.
+
+    Every row gets a random key; we keep the max_samples smallest keys and
+    return those rows ordered by key. Larger samples therefore extend
+    smaller ones, as with sample_indices.
+    """
+    rng = random.Random(seed)
+    heap: List[Tuple[float, int, dict]] = []  # max-heap on key via negation
+    for i, row in enumerate(rows):
+        key = rng.random()
+        if len(heap) < max_samples:
+            heapq.heappush(heap, (-key, i, row))
+        elif key < -heap[0][0]:
+            heapq.heapreplace(heap, (-key, i, row))
+
+    return [row for _, _, row in sorted(heap, key=lambda x: (-x[0], x[1]))]
+
+
 def load_opus100_pair(
     lang_pair: str,
     split: str = "train",
     max_samples: int = 500,
     seed: int = 42,
+    sampler: str = "python",
+    streaming: bool = False,
 ) -> Tuple[List[str], List[str]]:
     """
     Load parallel sentences from OPUS-100 for a given language pair.
@@ -18,23 +75,30 @@ def load_opus100_pair(
         split: dataset split ("train", "validation", "test")
         max_samples: maximum number of sentence pairs to keep
         seed: random seed for sampling
+        sampler: index sampler for the mapped path, see sample_indices
+        streaming: stream the split instead of mapping it and draw a
+            seeded reservoir sample in one pass (for splits too large to
+            map); selects different sentences than the mapped path
 
     Returns:
         src_texts (English), ref_texts (target language)
     """
-    ds = load_dataset("Helsinki-NLP/opus-100", lang_pair, split=split)
-
     src_lang, tgt_lang = lang_pair.split("-")
 
-    indices = list(range(len(ds)))
-    random.Random(seed).shuffle(indices)
-    indices = indices[:max_samples]
+    if streaming:
+        ds = load_dataset("Helsinki-NLP/opus-100", lang_pair, split=split, streaming=True)
+        items = [
+            row["translation"]
+            for row in _reservoir_sample(iter(ds), max_samples, seed)
+        ]
+    else:
+        ds = load_dataset("Helsinki-NLP/opus-100", lang_pair, split=split)
+        indices = sample_indices(len(ds), max_samples, seed=seed, sampler=sampler)
+
+        # One bulk Arrow take instead of len(indices) random row lookups
+        items = ds.select(indices)["translation"]
 
-    src_texts = []
-    ref_texts = []
-    for i in indices:
-        item = ds[i]["translation"]
-        src_texts.append(item[src_lang])
-        ref_texts.append(item[tgt_lang])
+    src_texts = [item[src_lang] for item in items]
+    ref_texts = [item[tgt_lang] for item in items]
 
     return src_texts, ref_texts
@@ -0,0 +1,98 @@
+# embedding_cache.py
+
+import hashlib
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from sqlite_utils import connect_wal, key_chunks
+
+DEFAULT_EMBEDDING_CACHE_PATH = "cache/comet_embeddings.sqlite"
+
+# ~4KB per XLM-R-large sentence embedding -> about 1GB on disk
+DEFAULT_MAX_ENTRIES = 250_000
+
+
+def embedding_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded cache of sentence embeddings (float32 vectors)
+    in a single SQLite file.
+
+    Every read refreshes an entry's last-used time; once the table holds
+    more than max_entries rows, the least recently used ones are dropped.
+    Keys come from embedding_key(model_id, text).
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_EMBEDDING_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = connect_wal(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " emb BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return {key: vector} for the keys that are present."""
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        with self._lock:
+            for chunk, placeholders in key_chunks(keys):
+                rows = self._conn.execute(
+                    f"SELECT key, emb FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                    [now, *chunk],
+                )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        """Insert (key, vector) pairs, then evict down to max_entries."""
+        now = time.time()
+        rows = [
+            (key, np.ascontiguousarray(vec, dtype=np.float32).tobytes(), now)
+            for key, vec in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, emb, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            n = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if n > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (n - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,127 @@
+# features.py -- typology feature schema + column-wise feature computation
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Bump when a feature definition changes, so stale feature data can be detected
+FEATURE_SCHEMA_VERSION = 1
+
+SURFACE_FEATURE_COLS = [
+    "src_len_tokens",
+    "ref_len_tokens",
+    "mt_len_tokens",
+    "src_len_chars",
+    "ref_len_chars",
+    "mt_len_chars",
+    "len_ratio_mt_src",
+    "len_ratio_ref_src",
+    "src_chars_per_token",
+    "ref_chars_per_token",
+    "mt_chars_per_token",
+    "src_ttr",
+    "ref_ttr",
+    "mt_ttr",
+]
+
+# sentence-level COMET
+SENTENCE_METRIC_COLS = ["comet_sentence"]
+
+# corpus-level metrics (same for all sentences in a language)
+CORPUS_METRIC_COLS = ["bleu_corpus", "chrf_corpus", "comet_corpus"]
+
+# What the classifier is trained on and predicts from, in this order
+FEATURE_COLS = SURFACE_FEATURE_COLS + SENTENCE_METRIC_COLS + CORPUS_METRIC_COLS
+
+
+# ---------- single-text helpers ----------
+
+def count_tokens(text: str) -> int:
+    return len(str(text).strip().split())
+
+
+def count_chars(text: str) -> int:
+    return len(str(text))
+
+
+def type_token_ratio(text: str) -> float:
+    tokens = str(text).strip().split()
+    if not tokens:
+        return 0.0
+    return len(set(tokens)) / len(tokens)
+
+
+# ---------- column-wise features ----------
+
+def _safe_div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """num / den, with 0.0 where den == 0 (matches the per-sentence rules)."""
+    out = np.zeros(len(num), dtype=float)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def _text_columns(texts: List[str]):
+    s = pd.Series(texts, dtype=object).astype(str)
+    n_chars = s.str.len().to_numpy(dtype=float)
+    tokens = s.str.split()
+    n_tokens = tokens.str.len().to_numpy(dtype=float)
+    ttr = np.fromiter(
+        (len(set(t)) / len(t) if t else 0.0 for t in tokens),
+        dtype=float,
+        count=len(tokens),
+    )
+    return n_tokens, n_chars, ttr
+
+
+def surface_features(src: List[str], ref: List[str], mt: List[str]) -> pd.DataFrame:
+    """
+    All SURFACE_FEATURE_COLS for aligned src/ref/mt lists, computed
+    column-wise. Same values as count_tokens / count_chars /
+    type_token_ratio applied sentence by sentence.
+    """
+    if not (len(src) == len(ref) == len(mt)):
+        raise ValueError(
+            f"src/ref/mt lengths differ: {len(src)}/{len(ref)}/{len(mt)}"
+        )
+
+    src_tok, src_char, src_ttr = _text_columns(src)
+    ref_tok, ref_char, ref_ttr = _text_columns(ref)
+    mt_tok, mt_char, mt_ttr = _text_columns(mt)
+
+    return pd.DataFrame({
+        "src_len_tokens": src_tok.astype(int),
+        "ref_len_tokens": ref_tok.astype(int),
+        "mt_len_tokens": mt_tok.astype(int),
+        "src_len_chars": src_char.astype(int),
+        "ref_len_chars": ref_char.astype(int),
+        "mt_len_chars": mt_char.astype(int),
+        "len_ratio_mt_src": _safe_div(mt_tok, src_tok),
+        "len_ratio_ref_src": _safe_div(ref_tok, src_tok),
+        "src_chars_per_token": _safe_div(src_char, src_tok),
+        "ref_chars_per_token": _safe_div(ref_char, ref_tok),
+        "mt_chars_per_token": _safe_div(mt_char, mt_tok),
+        "src_ttr": src_ttr,
+        "ref_ttr": ref_ttr,
+        "mt_ttr": mt_ttr,
+    }, columns=SURFACE_FEATURE_COLS)
+
+
+def build_feature_frame(
+    src: List[str],
+    ref: List[str],
+    mt: List[str],
+    comet_sentence: List[float],
+    bleu_corpus: float,
+    chrf_corpus: float,
+    comet_corpus: float,
+) -> pd.DataFrame:
+    """
+    FEATURE_COLS for one corpus, as used for both training and inference.
+    """
+    df = surface_features(src, ref, mt)
+    df["comet_sentence"] = np.asarray(comet_sentence, dtype=float)
+    df["bleu_corpus"] = bleu_corpus
+    df["chrf_corpus"] = chrf_corpus
+    df["comet_corpus"] = comet_corpus
+    return df[FEATURE_COLS]
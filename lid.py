@@ -1,33 +1,127 @@
 # lid.py
-import fasttext
 from functools import lru_cache
 from collections import Counter
+from math import sqrt
+from statistics import NormalDist
+from typing import List, MutableMapping, Optional, Tuple
 
 LID_MODEL_PATH = "models/lid.176.bin"
 
 @lru_cache(maxsize=1)
 def get_lid_model():
+    import fasttext  # imported lazily: the C extension is slow to load
     return fasttext.load_model(LID_MODEL_PATH)
 
+def _clean(text) -> str:
+    # fastText predicts one line at a time and rejects embedded newlines
+    return str(text).replace("\n", " ").strip()
+
 def detect_lang(text: str):
     model = get_lid_model()
-    cleaned = str(text).replace("\n", " ").strip()
+    cleaned = _clean(text)
     labels, probs = model.predict(cleaned, k=1)
     lang = labels[0].replace("__label__", "")
     return lang, float(probs[0])
 
-def majority_lang(texts, min_conf: float = 0.7):
+def _detect_chunk(texts: List[str]) -> List[Tuple[str, float]]:
+    labels, probs = get_lid_model().predict(texts, k=1)
+    return [
+        (lab[0].replace("__label__", ""), float(p[0]))
+        for lab, p in zip(labels, probs)
+    ]
+
+def detect_langs(
+    texts,
+    batch_size: int = 10000,
+    cache: Optional[MutableMapping[str, Tuple[str, float]]] = None,
+    processes: int = 1,
+) -> List[Tuple[str, float]]:
+    """
+    Batched detect_lang: one fastText predict() call per batch_size lines.
+
+    Args:
+        texts: sentences to identify
+        batch_size: lines per predict() call (and per task with processes > 1)
+        cache: optional dict-like {cleaned text: (lang, conf)}, read before
+            and updated after prediction; reuse it across calls
+        processes: > 1 splits the work over a multiprocessing pool
+            (worth it for corpora of ~100k lines and up)
+
+    Returns:
+        [(lang, conf), ...] aligned with texts
+    """
+    cleaned = [_clean(t) for t in texts]
+
+    # Each distinct text is predicted once
+    todo = list(dict.fromkeys(
+        t for t in cleaned if cache is None or t not in cache
+    ))
+    chunks = [todo[i: i + batch_size] for i in range(0, len(todo), batch_size)]
+
+    if processes > 1 and len(chunks) > 1:
+        from multiprocessing import Pool
+
+        with Pool(processes) as pool:
+            chunk_results = pool.map(_detect_chunk, chunks)
+    else:
+        chunk_results = [_detect_chunk(chunk) for chunk in chunks]
+
+    found = dict(zip(todo, (r for res in chunk_results for r in res)))
+    if cache is not None:
+        cache.update(found)
+        found = cache
+
+    return [found[t] for t in cleaned]
+
+def _majority_settled(counts: Counter, confidence: float) -> bool:
+    """
+    True once the leading language beats the runner-up at `confidence`:
+    the Wilson lower bound of leader / (leader + runner-up) exceeds 0.5.
+    """
+    top = counts.most_common(2)
+    if not top:
+        return False
+    n1 = top[0][1]
+    n2 = top[1][1] if len(top) > 1 else 0
+    n = n1 + n2
+    z = NormalDist().inv_cdf(confidence)
+    p = n1 / n
+    lower = (p + z * z / (2 * n) - z * sqrt(p * (1 - p) / n + z * z / (4 * n * n))) / (1 + z * z / n)
+    return lower > 0.5
+
+def majority_lang(
+    texts,
+    min_conf: float = 0.7,
+    early_stop: bool = False,
+    confidence: float = 0.999,
+    chunk_size: int = 500,
+    cache: Optional[MutableMapping[str, Tuple[str, float]]] = None,
+    processes: int = 1,
+):
     """
     Detect language for many sentences; return majority fastText code + stats.
+
+    With early_stop=True, sentences are identified chunk_size at a time and
+    we stop as soon as the majority among predictions with conf >= min_conf
+    is settled at `confidence` (see _majority_settled). "n_checked" reports
+    how many sentences were actually identified.
     """
+    texts = list(texts)
     counts = Counter()
     confs = []
 
-    for t in texts:
-        lang, conf = detect_lang(t)
-        if conf >= min_conf:
-            counts[lang] += 1
-            confs.append(conf)
+    step = chunk_size if early_stop else max(len(texts), 1)
+    n_checked = 0
+    for start in range(0, len(texts), step):
+        chunk = texts[start: start + step]
+        for lang, conf in detect_langs(chunk, cache=cache, processes=processes):
+            if conf >= min_conf:
+                counts[lang] += 1
+                confs.append(conf)
+        n_checked += len(chunk)
+
+        if early_stop and _majority_settled(counts, confidence):
+            break
 
     if not counts:
         # TODO: Add option to manually add
@@ -39,4 +133,5 @@ def majority_lang(texts, min_conf: float = 0.7):
         "n_high_conf": n,
         "avg_conf": sum(confs) / len(confs),
         "dist": dict(counts),
+        "n_checked": n_checked,
     }
@@ -1,11 +1,57 @@
 # metrics.py
 
-from typing import List
+import copy
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List
+
 import sacrebleu
-from comet import download_model, load_from_checkpoint
 
-COMET_MODEL_PATH = download_model("Unbabel/wmt22-comet-da")
-COMET_MODEL = load_from_checkpoint(COMET_MODEL_PATH)
+from batching import dedup, plan_token_batches
+from embedding_cache import embedding_key
+
+COMET_MODEL_NAME = "Unbabel/wmt22-comet-da"
+
+# Padded-token budget per encoder forward pass in the "fast" COMET engine
+COMET_MAX_TOKENS = 4096
+
+# Largest per-segment |fast - reference| we accept from the "fast" engine
+COMET_TOLERANCE = 0.02
+
+
+@lru_cache(maxsize=1)
+def get_comet_model():
+    """
+    Download (if needed) and load the COMET checkpoint on first use.
+    Importing this module stays cheap for BLEU/chrF-only callers.
+    """
+    from comet import download_model, load_from_checkpoint
+
+    model_path = download_model(COMET_MODEL_NAME)
+    return load_from_checkpoint(model_path)
+
+
+@lru_cache(maxsize=1)
+def get_quantized_comet_model():
+    """
+    Copy of the COMET model whose XLM-R encoder has its nn.Linear layers
+    dynamically quantized to int8 (CPU only). The estimator head stays fp32.
+    """
+    import torch
+
+    model = copy.deepcopy(get_comet_model())
+    model.encoder = torch.quantization.quantize_dynamic(
+        model.encoder, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return model
+
+
+def unload_comet_model():
+    get_comet_model.cache_clear()
+    get_quantized_comet_model.cache_clear()
 
 
 def compute_bleu(system_outputs: List[str], references: List[str]) -> float:
@@ -18,27 +64,329 @@ def compute_chrf(system_outputs: List[str], references: List[str]) -> float:
     return float(chrf.score)
 
 
-def compute_comet(
+def score_comet(
     src: List[str],
     mt: List[str],
     ref: List[str],
     batch_size: int = 16,
     use_gpu: bool = False,
-) -> float:
+    engine: str = "reference",
+    max_tokens: int = COMET_MAX_TOKENS,
+    quantize: bool = False,
+    num_workers: int = 1,
+    embedding_cache=None,
+    token_cache=None,
+) -> Dict[str, object]:
+    """
+    Run COMET once over (src, mt, ref) and return everything we need from it:
+
+        {"scores": per-sentence scores aligned with src/mt/ref,
+         "system_score": corpus score,
+         "seconds": wall-clock time spent in COMET,
+         "n_deduplicated": duplicate triples that were not re-scored}
+
+    engine:
+        "reference" -- COMET's own predict(), batch_size triples at a time
+        "fast"      -- our CPU path (see _predict_fast): every distinct
+                       sentence is embedded once, in length-sorted batches
+                       under a max_tokens budget, with tokenization spread
+                       over num_workers threads; quantize=True uses the
+                       int8 encoder. Check it with check_comet_tolerance().
+
+    embedding_cache: optional embedding_cache.EmbeddingCache ("fast" engine
+    only). Sentences already in it are not re-encoded, which makes
+    re-scoring the same English sources across languages and runs cheap.
+    token_cache: optional token_cache.TokenCache ("fast" engine only) for
+    the token ids of sentences that still have to be encoded.
+    """
+    if not (len(src) == len(mt) == len(ref)):
+        raise ValueError(
+            f"src/mt/ref lengths differ: {len(src)}/{len(mt)}/{len(ref)}"
+        )
+
+    if (embedding_cache is not None or token_cache is not None) and engine != "fast":
+        raise ValueError("embedding_cache / token_cache need engine='fast'.")
+
+    # Identical (src, mt, ref) triples are scored once and expanded back
+    unique, inverse = dedup(list(zip(src, mt, ref)))
+    u_src = [t[0] for t in unique]
+    u_mt = [t[1] for t in unique]
+    u_ref = [t[2] for t in unique]
+
+    start = time.perf_counter()
+    if engine == "reference":
+        u_scores = []
+        if unique:
+            u_scores, _ = _predict_reference(u_src, u_mt, u_ref, batch_size, use_gpu)
+    elif engine == "fast":
+        u_scores = _predict_fast(
+            u_src, u_mt, u_ref, batch_size, use_gpu, max_tokens, quantize, num_workers,
+            embedding_cache, token_cache,
+        )
+    else:
+        raise ValueError(f"Unknown COMET engine {engine!r} (expected 'reference' or 'fast')")
+    seconds = time.perf_counter() - start
+
+    if len(u_scores) != len(unique):
+        raise ValueError(
+            f"COMET returned {len(u_scores)} scores for {len(unique)} sentences."
+        )
+    seg_scores = [float(u_scores[j]) for j in inverse]
+
+    return {
+        "scores": seg_scores,
+        # COMET's system score is the mean of its segment scores (over
+        # every input, duplicates included)
+        "system_score": sum(seg_scores) / len(seg_scores) if seg_scores else float("nan"),
+        "seconds": seconds,
+        "n_deduplicated": len(src) - len(unique),
+    }
+
+
+def score_comet_resumable(
+    src: List[str],
+    mt: List[str],
+    ref: List[str],
+    checkpoint,
+    chunk_size: int = 256,
+    **kwargs,
+) -> Dict[str, object]:
+    """
+    score_comet over chunks of chunk_size triples, appending each chunk's
+    segment scores to `checkpoint` (a checkpoint.CheckpointLog) as soon as
+    it is done. Chunks already in the log (same position and same text)
+    are not scored again, so an interrupted run picks up where it stopped.
+    kwargs go to score_comet.
+    """
+    if not (len(src) == len(mt) == len(ref)):
+        raise ValueError(
+            f"src/mt/ref lengths differ: {len(src)}/{len(mt)}/{len(ref)}"
+        )
+
+    done = checkpoint.load()
+    if done:
+        print(f"[INFO] Resuming COMET from {checkpoint.path} ({len(done)} chunks done)")
+
+    scores: List[float] = []
+    seconds = 0.0
+    n_deduplicated = 0
+    for start in range(0, len(src), chunk_size):
+        chunk = (src[start: start + chunk_size], mt[start: start + chunk_size], ref[start: start + chunk_size])
+        content = hashlib.sha256(json.dumps(chunk, ensure_ascii=False).encode("utf-8")).hexdigest()
+        key = f"{start}:{content}"
+        if key in done:
+            scores.extend(done[key])
+            continue
+
+        result = score_comet(*chunk, **kwargs)
+        checkpoint.append([(key, result["scores"])])
+        scores.extend(result["scores"])
+        seconds += result["seconds"]
+        n_deduplicated += result["n_deduplicated"]
+
+    return {
+        "scores": scores,
+        "system_score": sum(scores) / len(scores) if scores else float("nan"),
+        "seconds": seconds,
+        "n_deduplicated": n_deduplicated,
+    }
+
+
+def _predict_reference(src, mt, ref, batch_size: int, use_gpu: bool):
     data = [{"src": s, "mt": m, "ref": r} for s, m, r in zip(src, mt, ref)]
 
-    result = COMET_MODEL.predict(
+    result = get_comet_model().predict(
         data,
         batch_size=batch_size,
         gpus=1 if use_gpu else 0,
         num_workers=1,   # important for macOS
     )
+    return _unpack_comet_result(result)
 
-    # New-style COMET (dict with 'system_score') - confusingly appears to switch
-    if isinstance(result, dict):
-        sys_score = result["system_score"]
+
+def _predict_fast(
+    src, mt, ref,
+    batch_size: int,
+    use_gpu: bool,
+    max_tokens: int,
+    quantize: bool,
+    num_workers: int,
+    embedding_cache=None,
+    token_cache=None,
+) -> List[float]:
+    """
+    Segment scores computed straight from the regression model's parts:
+    sentence embeddings (get_sentence_embedding) for every distinct text,
+    then the estimator head (estimate) over (src, mt, ref) embeddings.
+    The embedding of a sentence does not depend on whether it is used as
+    src, mt or ref, so each distinct text is encoded once.
+    """
+    import torch
+
+    if not src:
+        return []
+
+    if quantize and use_gpu:
+        raise ValueError("The int8 COMET encoder only runs on CPU.")
+    model = get_quantized_comet_model() if quantize else get_comet_model()
+    device = "cuda" if use_gpu else "cpu"
+    model.to(device)
+    model.eval()
+
+    texts = list(dict.fromkeys(str(t) for t in (*src, *mt, *ref)))
+    model_id = f"{COMET_MODEL_NAME}@int8" if quantize else COMET_MODEL_NAME
+    embeddings = _embed_texts(
+        model, texts, batch_size, max_tokens, num_workers, device,
+        cache=embedding_cache, model_id=model_id, token_cache=token_cache,
+    )
+    position = {t: i for i, t in enumerate(texts)}
+
+    scores: List[float] = []
+    with torch.inference_mode():
+        for i in range(0, len(src), 1024):
+            idx = [
+                torch.tensor([position[str(t)] for t in col[i: i + 1024]], device=device)
+                for col in (src, mt, ref)
+            ]
+            pred = model.estimate(*(embeddings[j] for j in idx))
+            scores.extend(pred.score.view(-1).tolist())
+    return scores
+
+
+def _embed_texts(
+    model,
+    texts: List[str],
+    batch_size: int,
+    max_tokens: int,
+    num_workers: int,
+    device: str,
+    cache=None,
+    model_id: str = COMET_MODEL_NAME,
+    token_cache=None,
+):
+    """
+    [len(texts), dim] sentence embeddings, computed in length-sorted batches
+    of at most max_tokens padded tokens (and batch_size * 4 rows, since
+    sorted batches waste little padding) and scattered back to input order.
+
+    With a cache, only texts missing from it are encoded; new embeddings are
+    written back after every batch. With a token_cache (token_cache.TokenCache),
+    token ids of texts seen before are read from it instead of re-tokenized.
+    """
+    import torch
+
+    out = [None] * len(texts)
+    keys = []
+    if cache is not None:
+        keys = [embedding_key(model_id, t) for t in texts]
+        found = cache.get_many(keys)
+        for i, k in enumerate(keys):
+            if k in found:
+                out[i] = torch.from_numpy(found[k].copy())
+    todo = [i for i in range(len(texts)) if out[i] is None]
+
+    tokenizer = model.encoder.tokenizer
+    max_length = model.encoder.max_positions - 2
+
+    def tokenize(chunk: List[str]) -> List[List[int]]:
+        return tokenizer(chunk, truncation=True, max_length=max_length)["input_ids"]
+
+    # Tokenization is the data-prep cost; spread it over worker threads
+    def tokenize_all(todo_texts: List[str]) -> List[List[int]]:
+        step = max(1, -(-len(todo_texts) // max(1, num_workers)))
+        chunks = [todo_texts[i: i + step] for i in range(0, len(todo_texts), step)]
+        if num_workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                return [ids for part in pool.map(tokenize, chunks) for ids in part]
+        return [ids for chunk in chunks for ids in tokenize(chunk)]
+
+    todo_texts = [texts[i] for i in todo]
+    if token_cache is not None and todo_texts:
+        token_ids = token_cache.encode(
+            f"{COMET_MODEL_NAME}:{max_length}", todo_texts, tokenize_all
+        )
     else:
-        # Old-style COMET (tuple: (seg_scores, sys_score))
-        seg_scores, sys_score = result
+        token_ids = tokenize_all(todo_texts)
+
+    batches = plan_token_batches([len(ids) for ids in token_ids], max_tokens, batch_size * 4)
+
+    with torch.inference_mode():
+        for batch in batches:
+            padded = tokenizer.pad(
+                {"input_ids": [token_ids[j] for j in batch]}, return_tensors="pt"
+            ).to(device)
+            emb = model.get_sentence_embedding(padded["input_ids"], padded["attention_mask"])
+            emb = emb.float().cpu()
+            for j, e in zip(batch, emb):
+                out[todo[j]] = e
+            if cache is not None:
+                cache.put_many((keys[todo[j]], e.numpy()) for j, e in zip(batch, emb))
+
+    return torch.stack(out).to(device)
+
+
+def check_comet_tolerance(
+    src: List[str],
+    mt: List[str],
+    ref: List[str],
+    max_delta: float = COMET_TOLERANCE,
+    **fast_kwargs,
+) -> Dict[str, object]:
+    """
+    Score the same triples with the reference and the "fast" engine and
+    compare. fast_kwargs go to score_comet (quantize, max_tokens, ...).
+
+    Returns {"max_abs_delta", "mean_abs_delta", "system_delta", "ok"}, where
+    ok means every segment score is within max_delta of the reference.
+    """
+    reference = score_comet(src, mt, ref, engine="reference")
+    fast = score_comet(src, mt, ref, engine="fast", **fast_kwargs)
+
+    deltas = [abs(a - b) for a, b in zip(reference["scores"], fast["scores"])]
+    max_abs = max(deltas) if deltas else 0.0
+    return {
+        "max_abs_delta": max_abs,
+        "mean_abs_delta": sum(deltas) / len(deltas) if deltas else 0.0,
+        "system_delta": fast["system_score"] - reference["system_score"],
+        "ok": max_abs <= max_delta,
+    }
+
+
+def _unpack_comet_result(result):
+    """
+    Return (seg_scores, sys_score) from whatever COMET.predict gave back.
+    """
+    # New-style COMET (Prediction object / dict) - confusingly appears to switch
+    if hasattr(result, "scores"):
+        return result.scores, result.system_score
+
+    if isinstance(result, dict):
+        seg_scores = (
+            result.get("scores")
+            or result.get("segments_scores")
+            or result.get("sentence_scores")
+        )
+        if seg_scores is None:
+            raise ValueError("COMET result dict has no sentence-level scores.")
+        sys_score = result.get("system_score")
+        if sys_score is None:
+            sys_score = sum(seg_scores) / len(seg_scores) if seg_scores else 0.0
+        return seg_scores, sys_score
 
-    return float(sys_score)
+    # Old-style COMET (tuple: (seg_scores, sys_score))
+    seg_scores, sys_score = result
+    return seg_scores, sys_score
+
+
+def compute_comet(
+    src: List[str],
+    mt: List[str],
+    ref: List[str],
+    batch_size: int = 16,
+    use_gpu: bool = False,
+) -> float:
+    """
+    Corpus-level COMET only. Prefer score_comet when segment scores are
+    needed as well, so the model runs once.
+    """
+    return score_comet(src, mt, ref, batch_size=batch_size, use_gpu=use_gpu)["system_score"]
@@ -1,14 +1,353 @@
 # mt_models.py  — using Facebook M2M100 for all language pairs
 
-from typing import List
-from transformers import M2M100Tokenizer, M2M100ForConditionalGeneration
+import gc
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
 from tqdm import tqdm
 
+from batching import dedup, plan_token_batches
+from token_cache import TokenCache
+from translation_store import TranslationStore, translation_key
+
+DEFAULT_MODEL_NAME = "facebook/m2m100_418M"
+
+# Padded-token budget per generate() call when using length-bucketed batching
+DEFAULT_MAX_TOKENS = 1024
+
+# How many (model, device, backend) entries may stay resident at once.
+# The 418M checkpoint is ~2GB in fp32, so one is enough for our runs.
+MAX_LOADED_MODELS = 1
+
+# Where the ONNX export of each checkpoint is kept between processes
+ONNX_EXPORT_DIR = "cache/onnx"
+
+_MODEL_REGISTRY: "OrderedDict[Tuple[str, str, str], tuple]" = OrderedDict()
+_REGISTRY_LOCK = threading.Lock()
+
+
+# ---------- inference backends ----------
+#
+# A backend is a loader (model_name, device) -> model object exposing the
+# Hugging Face generate() API. MTTranslator only ever calls generate(), so
+# anything that honours it (input_ids / attention_mask / forced_bos_token_id
+# / decoder_input_ids / max_length) can be plugged in with register_backend().
+
+def _load_torch(model_name: str, device: str):
+    from transformers import M2M100ForConditionalGeneration
+
+    model = M2M100ForConditionalGeneration.from_pretrained(model_name).to(device)
+    model.eval()
+    return model
+
+
+def _load_torch_int8(model_name: str, device: str):
+    """fp32 weights with every nn.Linear dynamically quantized to int8 (CPU only)."""
+    import torch
+
+    if device != "cpu":
+        raise ValueError("The torch-int8 backend only runs on CPU.")
+
+    model = _load_torch(model_name, "cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(model_name: str, device: str):
+    """
+    ONNX Runtime encoder/decoder export. use_cache=True exports the
+    decoder-with-past graph, so each decoding step reuses the KV cache
+    instead of re-running attention over the whole prefix.
+
+    The export runs once and is saved under ONNX_EXPORT_DIR; later
+    processes (and registry reloads) load the saved graphs. Delete the
+    directory to force a fresh export, e.g. after upgrading optimum.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError(
+            "The onnx backend needs `pip install optimum[onnxruntime]`."
+        ) from e
+
+    provider = "CUDAExecutionProvider" if device.startswith("cuda") else "CPUExecutionProvider"
+    export_dir = os.path.join(ONNX_EXPORT_DIR, model_name.replace("/", "--"))
+    if os.path.exists(os.path.join(export_dir, "config.json")):
+        return ORTModelForSeq2SeqLM.from_pretrained(
+            export_dir, use_cache=True, provider=provider
+        )
+
+    print(f"[INFO] Exporting {model_name} to ONNX (once) -> {export_dir}")
+    model = ORTModelForSeq2SeqLM.from_pretrained(
+        model_name, export=True, use_cache=True, provider=provider
+    )
+    # Save next to the target and rename, so concurrent workers never see a
+    # half-written export; if another one got there first, keep theirs
+    tmp_dir = f"{export_dir}.{os.getpid()}.tmp"
+    model.save_pretrained(tmp_dir)
+    try:
+        os.rename(tmp_dir, export_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return model
+
+
+BACKENDS = {
+    "torch": _load_torch,
+    "torch-int8": _load_torch_int8,
+    "onnx": _load_onnx,
+}
+
+
+def register_backend(name: str, loader):
+    """Make a new backend available to get_m2m100 / MTTranslator(backend=name)."""
+    BACKENDS[name] = loader
+
+
+def get_m2m100(
+    model_name: str = DEFAULT_MODEL_NAME,
+    device: str = "cpu",
+    backend: str = "torch",
+):
+    """
+    Return (tokenizer, model) for model_name on device with the given backend.
+
+    Weights are loaded at most once per process, device and backend; every
+    MTTranslator for the same model shares them. When a new entry would
+    exceed MAX_LOADED_MODELS, the least recently used one is evicted
+    *before* loading, so peak memory stays bounded.
+
+    Eviction only drops the registry's reference: memory is freed once no
+    one else holds the returned tuple. MTTranslator keeps only the registry
+    key and looks the weights up on each use; callers that hold the tuple
+    themselves must drop it before unload_m2m100() or loading another model.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; available: {sorted(BACKENDS)}")
+
+    key = (model_name, device, backend)
+    with _REGISTRY_LOCK:
+        if key in _MODEL_REGISTRY:
+            _MODEL_REGISTRY.move_to_end(key)
+            return _MODEL_REGISTRY[key]
+
+        while len(_MODEL_REGISTRY) >= MAX_LOADED_MODELS:
+            _MODEL_REGISTRY.popitem(last=False)
+            _release_memory()
+
+        # torch / transformers are imported on first load, not at module import
+        from transformers import M2M100Tokenizer
+
+        print(f"[INFO] Loading {model_name} on device={device} (backend={backend}) ...")
+        tokenizer = M2M100Tokenizer.from_pretrained(model_name)
+        model = BACKENDS[backend](model_name, device)
+
+        _MODEL_REGISTRY[key] = (tokenizer, model)
+        return tokenizer, model
+
+
+def unload_m2m100(
+    model_name: Optional[str] = None,
+    device: Optional[str] = None,
+    backend: Optional[str] = None,
+) -> int:
+    """
+    Drop registry entries matching model_name / device / backend (None = any).
+    Returns the number of entries removed. MTTranslators stay usable (they
+    reload on next use); (tokenizer, model) tuples held elsewhere keep
+    their weights alive until dropped.
+    """
+    with _REGISTRY_LOCK:
+        keys = [
+            k for k in _MODEL_REGISTRY
+            if (model_name is None or k[0] == model_name)
+            and (device is None or k[1] == device)
+            and (backend is None or k[2] == backend)
+        ]
+        for k in keys:
+            del _MODEL_REGISTRY[k]
+
+    if keys:
+        _release_memory()
+    return len(keys)
+
+
+def _release_memory():
+    import torch
+
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+# ---------- decoding policies ----------
+
+DECODING_MODES = ("fixed", "greedy", "adaptive")
+DEFAULT_DECODING = "adaptive"
+
+
+def cache_variant(backend: str = "torch", decoding: str = DEFAULT_DECODING) -> Optional[str]:
+    """
+    Name suffix of the translation caches (storage.cache_stem) produced by
+    this MT setup. fp32 PyTorch with fixed decoding is the unnamed variant:
+    every cache written before decoding modes existed holds that output.
+    """
+    return "_".join(
+        part for part, default in ((backend, "torch"), (decoding, "fixed"))
+        if part != default
+    ) or None
+
+
+class DecodingPolicy:
+    """
+    How generate() is called for a batch.
+
+      fixed    -- the checkpoint's own generation config (beam search for
+                  M2M100) with a hard max_length; the historical behaviour
+      greedy   -- greedy decoding only
+      adaptive -- greedy first; rows whose mean token log-probability is
+                  below min_avg_logprob, or that hit max_length without
+                  emitting </s>, are re-decoded with num_beams beams and a
+                  length limit of length_ratio * source tokens + length_slack
+                  (at least max_length, at most max_length_cap)
+
+    config() is what identifies the policy in translation-store keys.
+    """
+
+    def __init__(
+        self,
+        mode: str = DEFAULT_DECODING,
+        max_length: int = 128,
+        num_beams: int = 5,
+        min_avg_logprob: float = -0.8,
+        length_ratio: float = 2.0,
+        length_slack: int = 10,
+        max_length_cap: int = 512,
+    ):
+        if mode not in DECODING_MODES:
+            raise ValueError(f"Unknown decoding mode {mode!r} (expected one of {DECODING_MODES})")
+        self.mode = mode
+        self.max_length = max_length
+        self.num_beams = num_beams
+        self.min_avg_logprob = min_avg_logprob
+        self.length_ratio = length_ratio
+        self.length_slack = length_slack
+        self.max_length_cap = max_length_cap
+
+    def config(self) -> dict:
+        if self.mode == "fixed":
+            # same key as before policies existed, so stored translations stay valid
+            return {"max_length": self.max_length}
+        cfg = {"decoding": self.mode, "max_length": self.max_length}
+        if self.mode == "adaptive":
+            cfg.update({
+                "num_beams": self.num_beams,
+                "min_avg_logprob": self.min_avg_logprob,
+                "length_ratio": self.length_ratio,
+                "length_slack": self.length_slack,
+                "max_length_cap": self.max_length_cap,
+            })
+        return cfg
+
+    def generate(self, model, encoded, target_kwargs: dict):
+        """
+        Decode one tokenized batch; returns (one token-id sequence per row,
+        {"n_truncated", "n_low_conf", "n_escalated"}).
+        """
+        stats = {"n_truncated": 0, "n_low_conf": 0, "n_escalated": 0}
+        if self.mode == "fixed":
+            return list(model.generate(**encoded, **target_kwargs, max_length=self.max_length)), stats
+
+        out = model.generate(
+            **encoded,
+            **target_kwargs,
+            num_beams=1,
+            do_sample=False,
+            max_length=self.max_length,
+            output_scores=True,
+            return_dict_in_generate=True,
+        )
+        sequences = list(out.sequences)
+        if self.mode == "greedy":
+            return sequences, stats
+
+        import torch
+
+        cfg = model.config
+        n_steps = len(out.scores)
+        generated = out.sequences[:, -n_steps:]
+        logprobs = model.compute_transition_scores(out.sequences, out.scores, normalize_logits=True)
+
+        # With forced_bos_token_id the language token is the first "generated"
+        # step (log-prob 0); leave it out of the average
+        skip = 1 if "forced_bos_token_id" in target_kwargs else 0
+        mask = generated[:, skip:] != cfg.pad_token_id
+        avg_logprob = (logprobs[:, skip:] * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+        truncated = ~(generated == cfg.eos_token_id).any(dim=1)
+        low_conf = avg_logprob < self.min_avg_logprob
+        redo = (truncated | low_conf).nonzero().flatten()
+        stats.update({
+            "n_truncated": int(truncated.sum()),
+            "n_low_conf": int(low_conf.sum()),
+            "n_escalated": len(redo),
+        })
+        if not len(redo):
+            return sequences, stats
+
+        src_len = int(encoded["attention_mask"][redo].sum(dim=1).max())
+        # Never below the greedy limit, so truncated rows always get more room
+        limit = min(
+            self.max_length_cap,
+            max(self.max_length, 2 + math.ceil(self.length_ratio * src_len) + self.length_slack),
+        )
+        sub_target = {
+            k: (v[redo] if torch.is_tensor(v) else v) for k, v in target_kwargs.items()
+        }
+        beam = model.generate(
+            **{k: v[redo] for k, v in encoded.items()},
+            **sub_target,
+            num_beams=self.num_beams,
+            do_sample=False,
+            max_length=limit,
+        )
+        for row, seq in zip(redo.tolist(), beam):
+            sequences[row] = seq
+        return sequences, stats
+
+
 class MTTranslator:
-    def __init__(self, lang_pair: str, device: str = "cpu"):
+    def __init__(
+        self,
+        lang_pair: str,
+        device: str = "cpu",
+        model_name: str = DEFAULT_MODEL_NAME,
+        store: Optional[TranslationStore] = None,
+        backend: str = "torch",
+        decoding: Union[str, DecodingPolicy] = DEFAULT_DECODING,
+        token_cache: Optional[TokenCache] = None,
+    ):
         """
         lang_pair: e.g. 'en-tr'
         We always assume source = English ('en'), target = the other side.
+
+        This is a lightweight view: the weights come from the shared
+        registry (see get_m2m100), only the language pair is per-instance.
+
+        store: optional TranslationStore; sentences already in it are not
+        sent to the model, new translations are written back per batch.
+
+        backend: inference backend, see BACKENDS ("torch", "torch-int8", "onnx").
+
+        decoding: a DecodingPolicy or one of DECODING_MODES; "adaptive"
+        (default) decodes greedily and re-decodes only uncertain or
+        truncated segments with beam search.
+
+        token_cache: optional TokenCache; source token ids are read from it
+        instead of re-running the SentencePiece tokenizer.
         """
         src, tgt = lang_pair.split("-")
 
@@ -19,43 +358,195 @@ class MTTranslator:
         self.src_lang = src
         self.tgt_lang = tgt
 
-        # Load single multilingual model for all pairs
-        model_name = "facebook/m2m100_418M"
-        self.tokenizer = M2M100Tokenizer.from_pretrained(model_name)
-        self.model = M2M100ForConditionalGeneration.from_pretrained(model_name).to(device)
-
+        # Single multilingual model for all pairs, shared across instances.
+        # Only the registry key is kept (see the tokenizer / model properties),
+        # so an evicted model is not pinned by live translators
+        self.model_name = model_name
+        self.backend = backend
         self.device = device
+        get_m2m100(model_name, device, backend)
+
+        self.store = store
+        self.token_cache = token_cache
+
+        self.decoding = decoding if isinstance(decoding, DecodingPolicy) else DecodingPolicy(decoding)
+
+        # Identifies how generate() is called; part of the store key
+        self.generation_config = self.decoding.config()
+
+        self.last_stats: dict = {}
+
+    @property
+    def tokenizer(self):
+        return get_m2m100(self.model_name, self.device, self.backend)[0]
+
+    @property
+    def model(self):
+        return get_m2m100(self.model_name, self.device, self.backend)[1]
+
+    def translate_batch(
+        self,
+        src_texts: List[str],
+        batch_size: int = 8,
+        max_tokens: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Translate src_texts; returns exactly one output per input, in order.
+
+        Empty / missing inputs are not sent to the model and come back as
+        "" so that mt stays aligned with src/ref.
+
+        With max_tokens=None, inputs go through in fixed groups of
+        batch_size in their original order. With max_tokens set, inputs
+        are sorted by tokenized length and packed into batches of at most
+        max_tokens padded tokens (and at most batch_size rows), which
+        keeps one long sentence from inflating the padding of short ones.
 
-    def translate_batch(self, src_texts: List[str], batch_size: int = 8) -> List[str]:
-        outputs: List[str] = []
-        for i in tqdm(range(0, len(src_texts), batch_size), desc="Translating"):
-            batch = src_texts[i: i + batch_size]
-            
-            # Ensure all items in batch are valid strings
-            batch = [str(text) if text is not None else "" for text in batch]
-            batch = [text for text in batch if text.strip()]  # Remove empty strings
-            
-            if not batch:
-                continue
-
-            # set the source language
-            self.tokenizer.src_lang = self.src_lang
-
-            encoded = self.tokenizer(
-                batch,
+        Duplicate sentences are translated once. With a store, sentences
+        already translated under the same model, direction and generation
+        config are taken from it instead. Counts end up in self.last_stats.
+        """
+        return self._translate(src_texts, [self.tgt_lang] * len(src_texts), batch_size, max_tokens)
+
+    def translate_mixed(
+        self,
+        items: List[Tuple[str, str]],
+        batch_size: int = 8,
+        max_tokens: Optional[int] = None,
+    ) -> Dict[str, List[str]]:
+        """
+        Translate (text, target_lang) pairs from English into any mix of
+        target languages; returns {target_lang: translations}, each list in
+        the order its pairs appeared in `items`.
+
+        Batches are formed across languages (same rules as translate_batch),
+        so the tail of one language fills up with sentences for another
+        instead of running as its own under-filled batch. Each row's
+        decoder starts from its own </s> + target-language token.
+        """
+        texts = [text for text, _ in items]
+        tgt_langs = [lang for _, lang in items]
+        outputs = self._translate(texts, tgt_langs, batch_size, max_tokens)
+
+        grouped: Dict[str, List[str]] = {}
+        for lang, out in zip(tgt_langs, outputs):
+            grouped.setdefault(lang, []).append(out)
+        return grouped
+
+    def _translate(
+        self,
+        src_texts: List[str],
+        tgt_langs: List[str],
+        batch_size: int,
+        max_tokens: Optional[int],
+    ) -> List[str]:
+        texts = [str(text) if text is not None else "" for text in src_texts]
+        outputs = [""] * len(texts)
+
+        todo = [i for i, text in enumerate(texts) if text.strip()]
+
+        # Each distinct (sentence, target) is translated once and copied back
+        # to every position it occurs at
+        unique, inverse = dedup([(texts[i], tgt_langs[i]) for i in todo])
+        unique_out: List[Optional[str]] = [None] * len(unique)
+
+        keys: List[str] = []
+        if self.store is not None and unique:
+            keys = [self._store_key(text, tgt) for text, tgt in unique]
+            cached = self.store.get_many(keys)
+            for j, key in enumerate(keys):
+                if key in cached:
+                    unique_out[j] = cached[key]
+        pending = [j for j, out in enumerate(unique_out) if out is None]
+
+        self.last_stats = {
+            "n_inputs": len(texts),
+            "n_empty": len(texts) - len(todo),
+            "n_deduplicated": len(todo) - len(unique),
+            "n_store_hits": len(unique) - len(pending),
+            "n_translated": len(pending),
+            "n_escalated": 0,
+        }
+        if len(set(tgt_langs)) > 1:
+            self.last_stats["n_target_langs"] = len(set(tgt_langs))
+        print(f"[INFO] Translation stats: {self.last_stats}")
+
+        # set the source language
+        self.tokenizer.src_lang = self.src_lang
+
+        # Tokenize once (or read the ids from the token cache); the same ids
+        # feed the batch planner and the padded model inputs
+        token_ids = self._token_ids([unique[j][0] for j in pending]) if pending else []
+
+        if max_tokens is None:
+            planned = [
+                list(range(i, min(i + batch_size, len(pending))))
+                for i in range(0, len(pending), batch_size)
+            ]
+        else:
+            planned = plan_token_batches([len(ids) for ids in token_ids], max_tokens, batch_size)
+
+        for batch in tqdm(planned, desc="Translating"):
+            batch_idx = [pending[k] for k in batch]
+            batch_langs = [unique[j][1] for j in batch_idx]
+
+            encoded = self.tokenizer.pad(
+                {"input_ids": [token_ids[k] for k in batch]},
                 return_tensors="pt",
-                padding=True,
-                truncation=True,
             ).to(self.device)
 
-            generated_tokens = self.model.generate(
-                **encoded,
-                forced_bos_token_id=self.tokenizer.get_lang_id(self.tgt_lang),
-                max_length=128,
+            generated_tokens, decode_stats = self.decoding.generate(
+                self.model, encoded, self._target_kwargs(batch_langs)
             )
+            self.last_stats["n_escalated"] += decode_stats["n_escalated"]
 
-            outputs.extend(
-                self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+            decoded = self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+            for j, out in zip(batch_idx, decoded):
+                unique_out[j] = out
+
+            if self.store is not None:
+                self.store.put_many((keys[j], unique_out[j]) for j in batch_idx)
+
+        if self.decoding.mode == "adaptive" and pending:
+            print(
+                f"[INFO] Adaptive decoding: {self.last_stats['n_escalated']}/{len(pending)} "
+                f"segments re-decoded with beam search"
             )
 
+        for pos, i in enumerate(todo):
+            outputs[i] = unique_out[inverse[pos]]
+
         return outputs
+
+    def _token_ids(self, texts: List[str]) -> List[List[int]]:
+        def tokenize(chunk: List[str]) -> List[List[int]]:
+            return self.tokenizer(chunk, truncation=True)["input_ids"]
+
+        if self.token_cache is None:
+            return tokenize(texts)
+        # The source-language prefix token is part of the ids
+        tokenizer_id = f"{self.model_name}:{self.src_lang}:{self.tokenizer.model_max_length}"
+        return self.token_cache.encode(tokenizer_id, texts, tokenize)
+
+    def _target_kwargs(self, tgt_langs: List[str]) -> dict:
+        """generate() arguments that steer each row to its target language."""
+        lang_ids = [self.tokenizer.get_lang_id(lang) for lang in tgt_langs]
+        if len(set(lang_ids)) == 1:
+            return {"forced_bos_token_id": lang_ids[0]}
+
+        # Mixed batch: start every row's decoder from [</s>, <target lang>],
+        # which is exactly what forced_bos_token_id produces for one language
+        import torch
+
+        start = self.model.config.decoder_start_token_id
+        decoder_input_ids = torch.tensor(
+            [[start, lang_id] for lang_id in lang_ids], device=self.device
+        )
+        return {"decoder_input_ids": decoder_input_ids}
+
+    def _store_key(self, text: str, tgt_lang: Optional[str] = None) -> str:
+        # Non-default backends can change the output, so they get their own keys
+        model_id = self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+        return translation_key(
+            model_id, self.src_lang, tgt_lang or self.tgt_lang, self.generation_config, text
+        )
@@ -0,0 +1,290 @@
+# pipeline.py -- streaming MT -> COMET -> features for one language
+
+import argparse
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+import pandas as pd
+
+from checkpoint import CHECKPOINT_DIR, CheckpointLog
+from config import LANG_CONFIG
+from features import surface_features
+from metrics import compute_bleu, compute_chrf, score_comet
+from mt_models import (
+    DECODING_MODES,
+    DEFAULT_DECODING,
+    DEFAULT_MAX_TOKENS,
+    MTTranslator,
+    cache_variant,
+)
+
+_DONE = object()
+
+
+class StreamingPipeline:
+    """
+    Overlap translation, COMET scoring and feature extraction for one corpus.
+
+    The corpus is cut into chunks of `chunk_size` sentences that flow through
+
+        producer -> [MT thread] -> [COMET thread] -> features (caller thread)
+
+    over bounded queues of `queue_size` chunks, so a slow stage blocks the
+    ones upstream of it instead of letting work pile up in memory
+    (backpressure). Finished chunks are appended to `checkpoint_path`
+    (a CheckpointLog keyed by chunk start); rerunning with the same file
+    skips them.
+    """
+
+    def __init__(
+        self,
+        translator: MTTranslator,
+        chunk_size: int = 128,
+        queue_size: int = 2,
+        batch_size: int = 32,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        comet_batch_size: int = 16,
+        use_gpu: bool = False,
+        checkpoint_path: Optional[str] = None,
+    ):
+        self.translator = translator
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.comet_batch_size = comet_batch_size
+        self.use_gpu = use_gpu
+        self.checkpoint_path = checkpoint_path
+        self._log = CheckpointLog(checkpoint_path) if checkpoint_path else None
+
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self.stage_seconds = {"mt": 0.0, "comet": 0.0, "features": 0.0}
+
+    # ---------- checkpointing ----------
+
+    def _load_checkpoint(self, n: int) -> dict:
+        done = {}
+        if not self._log:
+            return done
+
+        for start, rec in self._log.load().items():
+            if rec["chunk_size"] != self.chunk_size or rec["n"] != n:
+                raise ValueError(
+                    f"Checkpoint {self._log.path} was written with a "
+                    f"different chunk_size / corpus size; remove it to restart."
+                )
+            done[int(start)] = rec["rows"]
+
+        print(f"[INFO] Resuming: {len(done)} chunks already in {self._log.path}")
+        return done
+
+    def _append_checkpoint(self, start: int, n: int, rows: List[dict]):
+        if not self._log:
+            return
+        self._log.append([(str(start), {"chunk_size": self.chunk_size, "n": n, "rows": rows})])
+
+    # ---------- stages ----------
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once another stage has failed."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _run_stage(self, name: str, fn, in_q: queue.Queue, out_q: queue.Queue):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                result = fn(item)
+                self.stage_seconds[name] += time.perf_counter() - start
+                if not self._put(out_q, result):
+                    return
+        except BaseException as e:  # surfaced in run()
+            self._errors.append(e)
+            self._stop.set()
+            return
+        self._put(out_q, _DONE)
+
+    def _translate(self, chunk: dict) -> dict:
+        chunk["mt"] = self.translator.translate_batch(
+            chunk["src"], batch_size=self.batch_size, max_tokens=self.max_tokens
+        )
+        return chunk
+
+    def _score(self, chunk: dict) -> dict:
+        chunk["comet"] = score_comet(
+            chunk["src"],
+            chunk["mt"],
+            chunk["ref"],
+            batch_size=self.comet_batch_size,
+            use_gpu=self.use_gpu,
+        )["scores"]
+        return chunk
+
+    # ---------- driver ----------
+
+    def run(self, src_texts: List[str], ref_texts: List[str]) -> pd.DataFrame:
+        """
+        Return one row per sentence: src/ref/mt, surface features,
+        comet_sentence and the corpus-level BLEU/chrF/COMET columns.
+        """
+        n = len(src_texts)
+        done = self._load_checkpoint(n)
+        self._stop.clear()
+        self._errors = []
+
+        mt_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        comet_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        feat_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=("mt", self._translate, mt_q, comet_q), daemon=True),
+            threading.Thread(target=self._run_stage, args=("comet", self._score, comet_q, feat_q), daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        def produce():
+            for start in range(0, n, self.chunk_size):
+                if start in done:
+                    continue
+                chunk = {
+                    "start": start,
+                    "src": src_texts[start: start + self.chunk_size],
+                    "ref": ref_texts[start: start + self.chunk_size],
+                }
+                if not self._put(mt_q, chunk):
+                    return
+            self._put(mt_q, _DONE)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                chunk = self._get(feat_q)
+                if chunk is _DONE:
+                    break
+                t0 = time.perf_counter()
+                feats = surface_features(chunk["src"], chunk["ref"], chunk["mt"])
+                feats.insert(0, "mt", chunk["mt"])
+                feats.insert(0, "ref", chunk["ref"])
+                feats.insert(0, "src", chunk["src"])
+                feats["comet_sentence"] = chunk["comet"]
+                rows = feats.to_dict(orient="records")
+                self.stage_seconds["features"] += time.perf_counter() - t0
+                self._append_checkpoint(chunk["start"], n, rows)
+                done[chunk["start"]] = rows
+                print(f"[INFO] Chunk {chunk['start']}–{chunk['start'] + len(rows)} of {n} done")
+        finally:
+            self._stop.set()
+            producer.join()
+            for t in threads:
+                t.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        rows = [row for start in sorted(done) for row in done[start]]
+        df = pd.DataFrame(rows)
+
+        # Corpus-level metrics need the whole corpus, so they come last
+        if len(df):
+            df["bleu_corpus"] = compute_bleu(df["mt"].tolist(), df["ref"].tolist())
+            df["chrf_corpus"] = compute_chrf(df["mt"].tolist(), df["ref"].tolist())
+            # COMET's system score is the mean of its segment scores
+            df["comet_corpus"] = float(df["comet_sentence"].mean())
+        return df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream one language through MT, COMET and feature extraction."
+    )
+    parser.add_argument("lang", choices=list(LANG_CONFIG.keys()))
+    parser.add_argument("--max-samples", type=int, default=500)
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--chunk-size", type=int, default=128)
+    parser.add_argument("--decoding", choices=DECODING_MODES, default=DEFAULT_DECODING,
+                        help="MT decoding policy (see mt_models.DecodingPolicy)")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    args = parser.parse_args()
+
+    import torch
+    from build_typology_dataset import build_language_frame, language_fingerprint
+    from data_loading import load_opus100_pair
+    from storage import (
+        DATASET_DIR,
+        cache_stem,
+        read_manifest,
+        write_cache,
+        write_dataset_partition,
+        write_manifest,
+    )
+    from token_cache import TokenCache
+    from translation_store import TranslationStore
+
+    cfg = LANG_CONFIG[args.lang]
+    pair = cfg["pair"]
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    variant = cache_variant(decoding=args.decoding)
+
+    src_texts, ref_texts = load_opus100_pair(
+        pair, split=args.split, max_samples=args.max_samples, seed=42
+    )
+    # deal with de-en, for instance (make src always store english)
+    if pair.split("-")[0] != "en":
+        src_texts, ref_texts = ref_texts, src_texts
+
+    stem = cache_stem(pair, args.max_samples, args.split, variant)
+
+    store = TranslationStore()
+    translator = MTTranslator(
+        pair, device=device, store=store, decoding=args.decoding, token_cache=TokenCache()
+    )
+    pipeline = StreamingPipeline(
+        translator,
+        chunk_size=args.chunk_size,
+        use_gpu=device.startswith("cuda"),
+        checkpoint_path=os.path.join(args.checkpoint_dir, f"{stem}.stream.jsonl"),
+    )
+    df = pipeline.run(src_texts, ref_texts)
+    store.close()
+
+    # Same cache, partition layout and manifest entry as run_language_eval +
+    # build_typology_dataset, so a later incremental build sees it as current
+    cache = df[["src", "ref", "mt"]]
+    cache_path = write_cache(cache, args.lang, pair, args.max_samples, args.split, variant)
+    print(f"[INFO] Saved translations to {cache_path}")
+
+    part = build_language_frame(args.lang, cache, comet_scores=df["comet_sentence"].tolist())
+    write_dataset_partition(part, args.lang)
+    manifest = read_manifest()
+    manifest[args.lang] = language_fingerprint(args.lang, cache, args.max_samples, args.split)
+    write_manifest(manifest)
+
+    print(f"[INFO] Stage seconds: {pipeline.stage_seconds}")
+    print(f"[INFO] Saved {len(part)} rows to the {args.lang} partition of {DATASET_DIR}/")
+
+
+if __name__ == "__main__":
+    main()
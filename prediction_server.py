@@ -0,0 +1,355 @@
+# prediction_server.py -- local HTTP service with warm models and request micro-batching
+
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# How long the first request of a batch waits for others to join it
+DEFAULT_WINDOW_MS = 10.0
+
+# Upper bucket bounds (ms) of the latency histograms; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+# Upper bucket bounds of the batch-size histograms
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram; the last bucket is open-ended."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            counts = list(self._counts)
+            total = sum(counts)
+            value_sum = self._sum
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": total,
+            "mean": value_sum / total if total else None,
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesces items submitted by concurrent requests into shared calls of
+    `fn(items) -> results` (one result per item, in order).
+
+    A single worker thread owns the model: it takes the first waiting item,
+    keeps collecting until max_batch items or window_ms have passed, runs
+    fn once and hands every caller its own results.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[object]], List[object]],
+        max_batch: int = 256,
+        window_ms: float = DEFAULT_WINDOW_MS,
+        name: str = "batcher",
+    ):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.name = name
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit_many(self, items: List[object]) -> List[object]:
+        """Queue items and block until all their results are in."""
+        futures = []
+        for item in items:
+            fut: Future = Future()
+            self._queue.put((item, fut))
+            futures.append(fut)
+        return [fut.result() for fut in futures]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            self.batch_sizes.observe(len(items))
+            try:
+                results = self.fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+
+
+class PredictionService:
+    """
+    The LID -> MT -> COMET -> features -> classifier pipeline of a
+    TypologyPredictor behind two micro-batchers, one per heavy model:
+
+      translate: items are (text, tgt_lang)
+      score:     items are (src, mt, ref)
+
+    /predict requests go through the same batchers, so a mystery corpus and
+    concurrent /translate or /score calls share model batches.
+    """
+
+    def __init__(self, predictor, window_ms: float = DEFAULT_WINDOW_MS, max_batch: int = 256):
+        self.predictor = predictor
+        self.translate_batcher = MicroBatcher(self._translate_items, max_batch, window_ms, "translate")
+        self.score_batcher = MicroBatcher(self._score_items, max_batch, window_ms, "score")
+        self.latency_ms: Dict[str, Histogram] = {
+            name: Histogram(LATENCY_BUCKETS_MS) for name in ("translate", "score", "predict")
+        }
+        self.started = time.time()
+
+    # ---------- batch functions (run on the batcher threads) ----------
+
+    def _translate_items(self, items):
+        # One mixed-target call: requests for different languages share batches
+        p = self.predictor
+        with p._mt_lock:
+            grouped = p.translator(items[0][1]).translate_mixed(
+                items, batch_size=p.batch_size, max_tokens=p.max_tokens
+            )
+        per_lang = {lang: iter(outs) for lang, outs in grouped.items()}
+        return [next(per_lang[lang]) for _, lang in items]
+
+    def _score_items(self, items):
+        from metrics import score_comet
+
+        p = self.predictor
+        with p._comet_lock:
+            return score_comet(
+                [t[0] for t in items],
+                [t[1] for t in items],
+                [t[2] for t in items],
+                batch_size=p.comet_batch_size,
+                use_gpu=p.use_gpu,
+            )["scores"]
+
+    def _check_tgt_lang(self, tgt_lang: str):
+        """
+        ValueError (-> HTTP 400) unless M2M100 can translate into tgt_lang.
+        Checked before submitting: a bad code inside a shared batch would
+        fail every request in it.
+        """
+        from mt_models import get_m2m100
+
+        p = self.predictor
+        tokenizer, _ = get_m2m100(device=p.device, backend=p.backend)
+        try:
+            tokenizer.get_lang_id(tgt_lang)
+        except (KeyError, TypeError):
+            raise ValueError(f"Unsupported target language {tgt_lang!r}") from None
+
+    # ---------- endpoints ----------
+
+    def translate(self, texts: List[str], tgt_lang: str) -> Dict[str, object]:
+        self._check_tgt_lang(tgt_lang)
+        return {"translations": self.translate_batcher.submit_many([(t, tgt_lang) for t in texts])}
+
+    def score(self, src: List[str], mt: List[str], ref: List[str]) -> Dict[str, object]:
+        from metrics import compute_bleu, compute_chrf
+
+        if not (len(src) == len(mt) == len(ref)):
+            raise ValueError(f"src/mt/ref lengths differ: {len(src)}/{len(mt)}/{len(ref)}")
+        scores = self.score_batcher.submit_many(list(zip(src, mt, ref)))
+        return {
+            "scores": scores,
+            "system_score": sum(scores) / len(scores) if scores else None,
+            "bleu": compute_bleu(mt, ref),
+            "chrf": compute_chrf(mt, ref),
+        }
+
+    def predict(self, en: List[str], unk: List[str]) -> Dict[str, object]:
+        from lid import majority_lang
+
+        if len(en) != len(unk):
+            raise ValueError(f"en/unk lengths differ: {len(en)}/{len(unk)}")
+        lid_info = majority_lang(unk, min_conf=self.predictor.min_conf)
+        self._check_tgt_lang(lid_info["ft_lang"])
+        mt = self.translate_batcher.submit_many([(t, lid_info["ft_lang"]) for t in en])
+        comet_scores = self.score_batcher.submit_many(list(zip(en, mt, unk)))
+
+        row = {
+            "n_sentences": len(en),
+            "lid_lang": lid_info["ft_lang"],
+            "lid_n_high_conf": lid_info["n_high_conf"],
+            "lid_avg_conf": lid_info["avg_conf"],
+            "lid_dist": lid_info["dist"],
+        }
+        row.update(self.predictor.classify(en, unk, mt, comet_scores))
+        return row
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "latency_ms": {name: h.snapshot() for name, h in self.latency_ms.items()},
+            "batch_sizes": {
+                b.name: b.batch_sizes.snapshot()
+                for b in (self.translate_batcher, self.score_batcher)
+            },
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # POST path -> (service method, JSON fields passed to it)
+    ROUTES = {
+        "/translate": ("translate", ["texts", "tgt_lang"]),
+        "/score": ("score", ["src", "mt", "ref"]),
+        "/predict": ("predict", ["en", "unk"]),
+    }
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/metrics":
+            self._send(200, service.metrics())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path not in self.ROUTES:
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        method, fields = self.ROUTES[self.path]
+
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            missing = [f for f in fields if f not in payload]
+            if missing:
+                raise ValueError(f"missing fields: {missing}")
+            status, body = 200, getattr(service, method)(*(payload[f] for f in fields))
+        except (ValueError, TypeError) as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            print(f"[WARN] {self.path} failed: {e}")
+            status, body = 500, {"error": str(e)}
+        # Recorded before replying, so a client's next /metrics call sees it
+        service.latency_ms[method].observe((time.perf_counter() - start) * 1000.0)
+        self._send(status, body)
+
+    def _send(self, status: int, body: Dict[str, object]):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # per-request access logs would drown the [INFO] output
+
+
+def make_server(
+    service: PredictionService,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+) -> ThreadingHTTPServer:
+    """HTTP server bound to host:port (port=0 picks a free one); call serve_forever()."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+class PredictionClient:
+    """Minimal JSON client for a running prediction server."""
+
+    def __init__(self, base_url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout: float = 600.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="GET" if payload is None else "POST",
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def translate(self, texts: List[str], tgt_lang: str) -> List[str]:
+        return self._request("/translate", {"texts": texts, "tgt_lang": tgt_lang})["translations"]
+
+    def score(self, src: List[str], mt: List[str], ref: List[str]) -> Dict[str, object]:
+        return self._request("/score", {"src": src, "mt": mt, "ref": ref})
+
+    def predict(self, en: List[str], unk: List[str]) -> Dict[str, object]:
+        return self._request("/predict", {"en": en, "unk": unk})
+
+    def metrics(self) -> Dict[str, object]:
+        return self._request("/metrics")
+
+
+def main():
+    from typology_predictor import TypologyPredictor
+
+    parser = argparse.ArgumentParser(description="Serve translation, scoring and typology prediction locally.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--clf", default=None, help="defaults to the classifier for --level")
+    parser.add_argument("--level", choices=["sentence", "corpus"], default="sentence")
+    parser.add_argument("--window-ms", type=float, default=DEFAULT_WINDOW_MS,
+                        help="how long a request waits for others to share its model batch")
+    parser.add_argument("--max-batch", type=int, default=256,
+                        help="most sentences coalesced into one model call")
+    args = parser.parse_args()
+
+    predictor = TypologyPredictor(clf_path=args.clf, device=args.device, level=args.level,
+                                  use_gpu=args.device.startswith("cuda"))
+    service = PredictionService(predictor, window_ms=args.window_ms, max_batch=args.max_batch)
+    server = make_server(service, args.host, args.port)
+    print(f"[INFO] Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,40 @@
 # run_language_eval.py
 
+import argparse
+import multiprocessing
 import os
 import pandas as pd
-import torch
 import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from typing import List, Optional
 from config import LANG_CONFIG
 from data_loading import load_opus100_pair
-from mt_models import MTTranslator
-from metrics import compute_bleu, compute_chrf, compute_comet
+from mt_models import (
+    BACKENDS,
+    DECODING_MODES,
+    DEFAULT_DECODING,
+    DEFAULT_MAX_TOKENS,
+    MTTranslator,
+    cache_variant,
+    unload_m2m100,
+)
+from checkpoint import CHECKPOINT_DIR, CheckpointLog
+from metrics import compute_bleu, compute_chrf, score_comet, score_comet_resumable
+from storage import cache_stem, read_cache, write_cache
+from token_cache import TokenCache
+from translation_store import TranslationStore
+from work_queue import (
+    DEFAULT_LEASE_SECONDS,
+    WorkQueue,
+    init_queue,
+    print_status,
+    run_worker,
+    shard_ranges,
+)
+
+# Job kind of one (language, shard) unit in --queue-dir mode
+EVAL_JOB = "eval"
 
 def _clean_list(xs):
     cleaned = []
@@ -20,25 +47,39 @@ def _clean_list(xs):
         cleaned.append(str(x))
     return cleaned
 
+
 def evaluate_language(
     lang_code: str,
     max_samples: int = 500,
     split: str = "train",
     device: str = None,
+    backend: str = "torch",
+    resume: bool = False,
+    decoding: str = DEFAULT_DECODING,
 ) -> dict:
+    """
+    Translate (or load cached translations for) one language and score it.
+
+    Progress survives interruption: translations are written to the
+    translation store batch by batch, and COMET scores are logged chunk by
+    chunk under cache/checkpoints/. With resume=True, logged COMET chunks
+    are reused; otherwise that log is cleared first. Already translated
+    sentences are always taken from the store.
+
+    decoding: MT decoding mode, see mt_models.DecodingPolicy.
+    """
     cfg = LANG_CONFIG[lang_code]
     pair = cfg["pair"]  # e.g. "en-tr"
 
     if device is None:
+        import torch
         device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    # --- 1. Define cache path ---
-    cache_path = os.path.join("cache", f"{pair}_n{max_samples}_{split}.csv")
-
-    # --- 2. If cached translations exist, load them ---
-    if os.path.exists(cache_path):
-        print(f"Loading cached translations from {cache_path} ...")
-        df_cache = pd.read_csv(cache_path)
+    # --- 1./2. If cached translations exist (Parquet, or a legacy CSV), load them ---
+    variant = cache_variant(backend, decoding)
+    df_cache = read_cache(lang_code, pair, max_samples, split, variant)
+    if df_cache is not None:
+        print(f"Loading cached translations for {pair} ...")
 
         # Drop rows where any of src/ref/mt is missing
         df_cache = df_cache.dropna(subset=["src", "ref", "mt"])
@@ -58,8 +99,21 @@ def evaluate_language(
             src_texts, ref_texts = ref_texts, src_texts
 
         print(f"Running MT for {pair} on device={device} ...")
-        translator = MTTranslator(pair, device=device)
-        mt_texts = translator.translate_batch(src_texts, batch_size=8)
+        # Sentence-level store: only sentences not translated before (by this
+        # model, direction and decoding config) go through the model
+        store = TranslationStore()
+        translator = MTTranslator(
+            pair,
+            device=device,
+            store=store,
+            backend=backend,
+            decoding=decoding,
+            token_cache=TokenCache(),
+        )
+        mt_texts = translator.translate_batch(
+            src_texts, batch_size=32, max_tokens=DEFAULT_MAX_TOKENS
+        )
+        store.close()
 
         # Save to cache
         df_cache = pd.DataFrame({
@@ -67,19 +121,25 @@ def evaluate_language(
             "ref": ref_texts,
             "mt": mt_texts,
         })
-        df_cache.to_csv(cache_path, index=False)
+        cache_path = write_cache(df_cache, lang_code, pair, max_samples, split, variant)
         print(f"Saved cached translations to {cache_path}")
 
     print("Computing BLEU / chrF / COMET ...")
     bleu = compute_bleu(mt_texts, ref_texts)
     chrf = compute_chrf(mt_texts, ref_texts)
-    comet = compute_comet(
+    comet_log = CheckpointLog(os.path.join(
+        CHECKPOINT_DIR, cache_stem(pair, max_samples, split, variant) + ".comet.jsonl"
+    ))
+    if not resume:
+        comet_log.clear()
+    comet = score_comet_resumable(
         src_texts,
         mt_texts,
         ref_texts,
+        comet_log,
         batch_size=16,
         use_gpu=device.startswith("cuda"),
-    )
+    )["system_score"]
 
     return {
         "language": lang_code,
@@ -93,19 +153,323 @@ def evaluate_language(
     }
 
 
-def main():
+def _init_worker(n_threads: int):
+    """
+    Pin each pool worker to n_threads intra-op threads so that
+    workers * threads does not oversubscribe the machine.
+    Runs before torch is imported in the (spawned) worker.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+
+    import torch
+    torch.set_num_threads(n_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _progress_key(
+    lang: str, max_samples: int, split: str, backend: str, decoding: str = DEFAULT_DECODING
+) -> str:
+    return f"{lang}|n{max_samples}|{split}|{backend}|{decoding}"
+
+
+def run_parallel(
+    lang_codes: List[str],
+    workers: int,
+    max_samples: int = 500,
+    split: str = "train",
+    threads_per_worker: Optional[int] = None,
+    backend: str = "torch",
+    resume: bool = False,
+    progress: Optional[CheckpointLog] = None,
+    decoding: str = DEFAULT_DECODING,
+) -> pd.DataFrame:
+    """
+    Evaluate lang_codes on a pool of CPU worker processes, one language per task.
+
+    Each worker loads its own M2M100 + COMET (~5GB RAM), so pick `workers`
+    with memory in mind. Rows come back in lang_codes order regardless of
+    which worker finishes first.
+
+    progress: optional log of finished rows (see _progress_key); languages
+    already in it are not re-run, new ones are appended as they finish.
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    print(f"[INFO] {workers} workers x {threads_per_worker} torch threads")
+
+    # fork() after torch/OpenMP initialisation can deadlock; always spawn
+    ctx = multiprocessing.get_context("spawn")
+    finished = progress.load() if progress is not None else {}
+    keys = {lang: _progress_key(lang, max_samples, split, backend, decoding) for lang in lang_codes}
+    rows = {lang: finished[keys[lang]] for lang in lang_codes if keys[lang] in finished}
+    todo = [lang for lang in lang_codes if lang not in rows]
+    if rows:
+        print(f"[INFO] Resuming: {len(rows)} languages already finished")
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    ) as pool:
+        futures = {
+            pool.submit(
+                evaluate_language, lang, max_samples, split, "cpu", backend, resume, decoding
+            ): lang
+            for lang in todo
+        }
+        for fut in as_completed(futures):
+            lang = futures[fut]
+            rows[lang] = fut.result()
+            if progress is not None:
+                progress.append([(keys[lang], rows[lang])])
+            print(f"[INFO] Finished {lang} ({len(rows)}/{len(lang_codes)})")
+
+    return pd.DataFrame([rows[lang] for lang in lang_codes])
+
+
+# ---------- multi-node work queue ----------
+
+def queue_jobs(
+    lang_codes: List[str], max_samples: int, shard_size: int, split: str, backend: str, decoding: str
+) -> List[tuple]:
+    """
+    One EVAL_JOB per (language, shard of shard_size sentences). Shards cover
+    rows [0, max_samples) of the deterministic (seed=42) OPUS-100 sample; a
+    shard past the end of a smaller corpus is simply empty.
+    """
+    jobs = []
+    for lang in lang_codes:
+        for shard, (start, stop) in enumerate(shard_ranges(max_samples, shard_size)):
+            payload = {
+                "lang": lang,
+                "shard": shard,
+                "start": start,
+                "stop": stop,
+                "max_samples": max_samples,
+                "split": split,
+                "backend": backend,
+                "decoding": decoding,
+            }
+            jobs.append((f"{EVAL_JOB}-{lang}-{shard:05d}", EVAL_JOB, payload))
+    return jobs
+
+
+def run_eval_shard(queue: WorkQueue, payload: dict, job_id: str) -> dict:
+    """
+    Translate and COMET-score one shard; src/ref/mt/comet go to the queue's
+    result_dir. Reuses a finished local translation cache when there is one.
+    """
+    import torch
+
+    lang = payload["lang"]
+    pair = LANG_CONFIG[lang]["pair"]
+    start, stop = payload["start"], payload["stop"]
+    max_samples, split = payload["max_samples"], payload["split"]
+    backend, decoding = payload["backend"], payload["decoding"]
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    df_cache = read_cache(lang, pair, max_samples, split, cache_variant(backend, decoding))
+    if df_cache is not None:
+        df_cache = df_cache.dropna(subset=["src", "ref", "mt"]).iloc[start:stop]
+        src_texts = _clean_list(df_cache["src"].tolist())
+        ref_texts = _clean_list(df_cache["ref"].tolist())
+        mt_texts = _clean_list(df_cache["mt"].tolist())
+    else:
+        src_texts, ref_texts = load_opus100_pair(
+            pair, split=split, max_samples=max_samples, seed=42
+        )
+        if pair.split('-')[0] != "en":
+            src_texts, ref_texts = ref_texts, src_texts
+        src_texts, ref_texts = src_texts[start:stop], ref_texts[start:stop]
+
+        mt_texts = []
+        if src_texts:
+            store = TranslationStore()
+            translator = MTTranslator(
+                pair,
+                device=device,
+                store=store,
+                backend=backend,
+                decoding=decoding,
+                token_cache=TokenCache(),
+            )
+            mt_texts = translator.translate_batch(
+                src_texts, batch_size=32, max_tokens=DEFAULT_MAX_TOKENS
+            )
+            store.close()
+
+    comet_scores = []
+    if src_texts:
+        comet_scores = score_comet(
+            src_texts, mt_texts, ref_texts, batch_size=16, use_gpu=device.startswith("cuda")
+        )["scores"]
+
+    queue.write_frame(job_id, pd.DataFrame({
+        "src": src_texts,
+        "ref": ref_texts,
+        "mt": mt_texts,
+        "comet": comet_scores,
+    }, columns=["src", "ref", "mt", "comet"]))
+    return {"n_rows": len(src_texts)}
+
+
+def merge_queue(queue: WorkQueue) -> pd.DataFrame:
+    """
+    Once every shard is done: concatenate each language's shards in shard
+    order, write its translation cache and compute BLEU / chrF / COMET over
+    the whole language. The result does not depend on which worker ran
+    which shard, or how often.
+    """
+    config = queue.get_meta("config")
+    jobs = queue.require_done(EVAL_JOB)
+
+    variant = cache_variant(config["backend"], config["decoding"])
     rows = []
-    for lang in LANG_CONFIG.keys():
-        print("=" * 60)
-        print(f"Evaluating language: {lang}")
-        row = evaluate_language(lang)
-        rows.append(row)
-
-    df = pd.DataFrame(rows)
-    df.to_csv("mt_typology_results.csv", index=False)
+    for lang in config["langs"]:
+        cfg = LANG_CONFIG[lang]
+        pair = cfg["pair"]
+        df = queue.read_shards(EVAL_JOB, lang)
+        n_shards = sum(j["payload"]["lang"] == lang for j in jobs)
+
+        cache_path = write_cache(
+            df[["src", "ref", "mt"]], lang, pair, config["max_samples"], config["split"], variant
+        )
+        print(f"[INFO] Merged {n_shards} shard(s) of {lang} into {cache_path}")
+
+        mt_texts = df["mt"].tolist()
+        ref_texts = df["ref"].tolist()
+        rows.append({
+            "language": lang,
+            "pair": pair,
+            "typology": cfg["typology"],
+            "resource_level": cfg["resource_level"],
+            "BLEU": compute_bleu(mt_texts, ref_texts),
+            "chrF": compute_chrf(mt_texts, ref_texts),
+            # COMET's system score is the mean of its segment scores
+            "COMET": float(df["comet"].mean()) if len(df) else float("nan"),
+            "n_samples": len(df),
+        })
+    return pd.DataFrame(rows)
+
+
+def _queue_main(args):
+    queue = WorkQueue(args.queue_dir)
+    if args.role == "init":
+        config = {
+            "langs": args.langs,
+            "max_samples": args.max_samples,
+            "split": args.split,
+            "backend": args.backend,
+            "decoding": args.decoding,
+            "shard_size": args.shard_size,
+        }
+        init_queue(queue, config, queue_jobs(
+            args.langs, args.max_samples, args.shard_size, args.split, args.backend, args.decoding
+        ))
+    elif args.role == "work":
+        if args.threads_per_worker:
+            _init_worker(args.threads_per_worker)
+        run_worker(
+            queue, {EVAL_JOB: partial(run_eval_shard, queue)}, lease_seconds=args.lease_seconds
+        )
+        unload_m2m100()
+    elif args.role == "merge":
+        df = merge_queue(queue)
+        df.to_csv(args.out, index=False)
+        print("\nFinal results:")
+        print(df)
+    print_status(queue)
+    queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate MT quality per language.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes (1 = sequential, in-process)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch threads per worker (default: cpu_count // workers)")
+    parser.add_argument("--langs", nargs="+", default=list(LANG_CONFIG.keys()))
+    parser.add_argument("--max-samples", type=int, default=500)
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--backend", default="torch", choices=sorted(BACKENDS),
+                        help="MT inference backend (see mt_models.BACKENDS)")
+    parser.add_argument("--decoding", default=DEFAULT_DECODING, choices=DECODING_MODES,
+                        help="adaptive: greedy, beam search only for uncertain/truncated "
+                             "segments; fixed: the previous beam-search/max_length=128 setup")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run: skip finished languages and "
+                             "reuse logged COMET chunks (translations always come from the store)")
+    parser.add_argument("--out", default="mt_typology_results.csv")
+    parser.add_argument("--queue-dir", default=None,
+                        help="shared directory of a multi-node run (see --role); "
+                             "the run's settings are taken from --role init")
+    parser.add_argument("--role", choices=["init", "work", "merge", "status"], default="status",
+                        help="with --queue-dir: init enqueues (language, shard) jobs, work "
+                             "runs them until the queue is drained (start any number, on any "
+                             "node), merge writes caches and --out once all are done")
+    parser.add_argument("--shard-size", type=int, default=250,
+                        help="sentences per queued job")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="a job whose worker has not sent a heartbeat for this long is "
+                             "handed to another worker")
+    args = parser.parse_args()
+
+    if args.queue_dir:
+        _queue_main(args)
+        return
+
+    # One row per finished language, so a killed run can skip them on --resume
+    progress = CheckpointLog(os.path.join(CHECKPOINT_DIR, "run_language_eval.jsonl"))
+    if not args.resume:
+        progress.clear()
+
+    if args.workers > 1:
+        df = run_parallel(
+            args.langs,
+            args.workers,
+            max_samples=args.max_samples,
+            split=args.split,
+            threads_per_worker=args.threads_per_worker,
+            backend=args.backend,
+            resume=args.resume,
+            progress=progress,
+            decoding=args.decoding,
+        )
+    else:
+        finished = progress.load()
+        rows = []
+        for lang in args.langs:
+            key = _progress_key(lang, args.max_samples, args.split, args.backend, args.decoding)
+            if key in finished:
+                print(f"Skipping {lang}: already finished (--resume)")
+                rows.append(finished[key])
+                continue
+
+            print("=" * 60)
+            print(f"Evaluating language: {lang}")
+            row = evaluate_language(
+                lang,
+                max_samples=args.max_samples,
+                split=args.split,
+                backend=args.backend,
+                resume=args.resume,
+                decoding=args.decoding,
+            )
+            progress.append([(key, row)])
+            rows.append(row)
+
+        # M2M100 stays resident across languages; release it before reporting
+        unload_m2m100()
+
+        df = pd.DataFrame(rows)
+
+    df.to_csv(args.out, index=False)
     print("\nFinal results:")
     print(df)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
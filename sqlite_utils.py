@@ -0,0 +1,42 @@
+# sqlite_utils.py -- connection and lookup helpers shared by the SQLite caches
+
+import os
+import sqlite3
+from typing import Iterator, List, Sequence, Tuple
+
+# SQLite's default limit on bound parameters per statement is 999
+QUERY_CHUNK = 500
+
+
+def connect_wal(path: str, **kwargs) -> sqlite3.Connection:
+    """
+    Connection to a cache file in WAL mode, so readers and a writer in
+    several processes on one host do not block each other. The connection
+    may be used from any thread; callers serialise access with a lock.
+    kwargs go to sqlite3.connect (e.g. isolation_level=None).
+    """
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60, check_same_thread=False, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def key_chunks(keys: Sequence[str]) -> Iterator[Tuple[List[str], str]]:
+    """(chunk, "?,?,...") pairs of at most QUERY_CHUNK keys, for `IN (...)` clauses."""
+    for i in range(0, len(keys), QUERY_CHUNK):
+        chunk = list(keys[i: i + QUERY_CHUNK])
+        yield chunk, ",".join("?" * len(chunk))
+
+
+def select_in(conn: sqlite3.Connection, query: str, keys: Sequence[str]) -> List[tuple]:
+    """
+    All rows of `query` for keys, run chunk by chunk; query has one `{}`
+    where the placeholders of the IN list go, e.g.
+    "SELECT key, mt FROM translations WHERE key IN ({})".
+    """
+    rows: List[tuple] = []
+    for chunk, placeholders in key_chunks(keys):
+        rows.extend(conn.execute(query.format(placeholders), chunk).fetchall())
+    return rows
@@ -0,0 +1,255 @@
+# storage.py -- columnar (Parquet) storage for MT caches and the typology dataset
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from features import CORPUS_METRIC_COLS
+
+CACHE_DIR = "cache"
+CACHE_PARQUET_DIR = os.path.join(CACHE_DIR, "parquet")
+DATASET_DIR = "data/typology"
+
+_TEXT_COLS = ["src", "ref", "mt"]
+_CORPUS_KEY_COLS = ["lang", "pair", "typology"]
+
+
+# ---------- low-level helpers ----------
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    """Write df to path atomically (tmp file + rename)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_parquet(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def _read_legacy_csv(path: str) -> pd.DataFrame:
+    # Keep "" as "" instead of letting pandas turn it into NaN
+    return pd.read_csv(path, keep_default_na=False)
+
+
+# ---------- translation caches (src/ref/mt per language) ----------
+
+def cache_stem(pair: str, max_samples: int, split: str, variant: Optional[str] = None) -> str:
+    """variant distinguishes non-default MT setups (e.g. a quantized backend)."""
+    stem = f"{pair}_n{max_samples}_{split}"
+    return f"{stem}_{variant}" if variant else stem
+
+
+def cache_parquet_path(
+    lang_code: str, pair: str, max_samples: int, split: str, variant: Optional[str] = None
+) -> str:
+    return os.path.join(
+        CACHE_PARQUET_DIR, f"lang={lang_code}", cache_stem(pair, max_samples, split, variant) + ".parquet"
+    )
+
+
+def cache_csv_path(pair: str, max_samples: int, split: str) -> str:
+    return os.path.join(CACHE_DIR, cache_stem(pair, max_samples, split) + ".csv")
+
+
+def write_cache(
+    df: pd.DataFrame,
+    lang_code: str,
+    pair: str,
+    max_samples: int,
+    split: str,
+    variant: Optional[str] = None,
+) -> str:
+    path = cache_parquet_path(lang_code, pair, max_samples, split, variant)
+    _write_parquet(df[_TEXT_COLS], path)
+    return path
+
+
+def read_cache(
+    lang_code: str,
+    pair: str,
+    max_samples: int,
+    split: str,
+    variant: Optional[str] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    src/ref/mt for one language: the Parquet cache if present, otherwise the
+    legacy cache/*.csv (default variant only), otherwise None.
+    """
+    path = cache_parquet_path(lang_code, pair, max_samples, split, variant)
+    if os.path.exists(path):
+        return _read_parquet(path, columns=_TEXT_COLS)
+    if variant:
+        return None
+
+    csv_path = cache_csv_path(pair, max_samples, split)
+    if os.path.exists(csv_path):
+        return _read_legacy_csv(csv_path)[_TEXT_COLS]
+
+    return None
+
+
+# ---------- typology dataset ----------
+#
+# data/typology/
+#   lang=<code>/part-0.parquet   one row per sentence: text + per-sentence features
+#   corpus_metrics.parquet       one row per language: bleu/chrf/comet_corpus
+#   manifest.json                what each partition was built from (incremental builds)
+#
+# Corpus metrics are stored once per language and joined back on read,
+# instead of being repeated on every sentence row.
+
+def write_dataset_partition(df: pd.DataFrame, lang_code: str, root: str = DATASET_DIR):
+    """Replace the partition for lang_code and its corpus-metrics row."""
+    sentence_cols = [c for c in df.columns if c not in CORPUS_METRIC_COLS and c != "lang"]
+    _write_parquet(df[sentence_cols], os.path.join(root, f"lang={lang_code}", "part-0.parquet"))
+
+    corpus_row = df[_CORPUS_KEY_COLS + CORPUS_METRIC_COLS].iloc[:1]
+    metrics_path = os.path.join(root, "corpus_metrics.parquet")
+    if os.path.exists(metrics_path):
+        existing = _read_parquet(metrics_path)
+        existing = existing[existing["lang"] != lang_code]
+        corpus_row = pd.concat([existing, corpus_row], ignore_index=True)
+    _write_parquet(corpus_row.sort_values("lang", kind="stable"), metrics_path)
+
+
+def remove_dataset_partition(lang_code: str, root: str = DATASET_DIR):
+    """Drop lang_code's partition and corpus-metrics row (no-op if absent)."""
+    shutil.rmtree(os.path.join(root, f"lang={lang_code}"), ignore_errors=True)
+
+    metrics_path = os.path.join(root, "corpus_metrics.parquet")
+    if os.path.exists(metrics_path):
+        existing = _read_parquet(metrics_path)
+        _write_parquet(existing[existing["lang"] != lang_code], metrics_path)
+
+
+def dataset_langs(root: str = DATASET_DIR) -> List[str]:
+    return sorted(
+        m.group(1)
+        for d in glob.glob(os.path.join(root, "lang=*"))
+        if (m := re.search(r"lang=([^/\\]+)$", d))
+    )
+
+
+def read_dataset(
+    columns: Optional[List[str]] = None,
+    langs: Optional[List[str]] = None,
+    root: str = DATASET_DIR,
+) -> pd.DataFrame:
+    """
+    Read the typology dataset, loading only `columns` (None = all).
+
+    Files are memory-mapped and only the requested columns are decoded, so
+    asking for feature columns never touches the raw src/ref/mt text.
+    Corpus-level metric columns are joined in from corpus_metrics.parquet.
+    With no partitions under root (e.g. all pruned), returns an empty
+    frame with the requested columns.
+    """
+    import pyarrow.dataset as ds
+    import pyarrow.fs
+
+    if not dataset_langs(root):
+        return pd.DataFrame(columns=columns if columns is not None else ["lang"] + CORPUS_METRIC_COLS)
+
+    wanted_corpus = [c for c in CORPUS_METRIC_COLS if columns is None or c in columns]
+    sentence_cols = None if columns is None else [
+        c for c in columns if c not in CORPUS_METRIC_COLS and c != "lang"
+    ]
+
+    dataset = ds.dataset(
+        root,
+        format="parquet",
+        partitioning="hive",
+        filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=True,
+        ignore_prefixes=["corpus_metrics", "manifest", ".", "_"],
+    )
+    flt = ds.field("lang").isin(langs) if langs is not None else None
+    scan_cols = None if sentence_cols is None else ["lang"] + sentence_cols
+    df = dataset.to_table(columns=scan_cols, filter=flt).to_pandas()
+    df["lang"] = df["lang"].astype(str)
+
+    if wanted_corpus:
+        metrics = _read_parquet(os.path.join(root, "corpus_metrics.parquet"), columns=["lang"] + wanted_corpus)
+        df = df.merge(metrics, on="lang", how="left")
+
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def dataset_exists(root: str = DATASET_DIR) -> bool:
+    """True if root holds corpus metrics and at least one lang=* partition."""
+    return os.path.exists(os.path.join(root, "corpus_metrics.parquet")) and bool(dataset_langs(root))
+
+
+def read_manifest(root: str = DATASET_DIR) -> Dict[str, dict]:
+    """{lang: fingerprint} of the partitions under root (see build_typology_dataset)."""
+    path = os.path.join(root, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(manifest: Dict[str, dict], root: str = DATASET_DIR):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# ---------- one-time conversion from CSV ----------
+
+def convert_legacy_csvs(
+    training_csv: str = "data/typology_training_data.csv",
+    root: str = DATASET_DIR,
+):
+    """
+    Convert existing cache/*.csv files and the training CSV to Parquet.
+    Safe to rerun; existing Parquet files are overwritten.
+    """
+    from config import LANG_CONFIG
+
+    pair_to_lang = {cfg["pair"]: code for code, cfg in LANG_CONFIG.items()}
+    for csv_path in sorted(glob.glob(os.path.join(CACHE_DIR, "*.csv"))):
+        m = re.match(r"(.+)_n(\d+)_(\w+)\.csv$", os.path.basename(csv_path))
+        if not m or m.group(1) not in pair_to_lang:
+            print(f"[WARN] Skipping unrecognised cache file {csv_path}")
+            continue
+        pair, max_samples, split = m.group(1), int(m.group(2)), m.group(3)
+        lang = pair_to_lang[pair]
+        out = write_cache(_read_legacy_csv(csv_path), lang, pair, max_samples, split)
+        print(f"[INFO] {csv_path} -> {out}")
+
+    if os.path.exists(training_csv):
+        df = _read_legacy_csv(training_csv)
+        for lang, part in df.groupby("lang", sort=True):
+            write_dataset_partition(part, str(lang), root=root)
+        print(f"[INFO] {training_csv} -> {root} ({df['lang'].nunique()} languages)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV caches/datasets to Parquet.")
+    parser.add_argument("--training-csv", default="data/typology_training_data.csv")
+    parser.add_argument("--root", default=DATASET_DIR)
+    args = parser.parse_args()
+    convert_legacy_csvs(training_csv=args.training_csv, root=args.root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# tests/test_batching.py -- token-budget batch planning and deduplication
+
+import random
+
+import pytest
+
+from batching import dedup, plan_token_batches
+
+
+def _check_plan(lengths, max_tokens, max_batch_size=None):
+    batches = plan_token_batches(lengths, max_tokens, max_batch_size)
+
+    # every item exactly once
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    for b in batches:
+        assert b
+        if max_batch_size is not None:
+            assert len(b) <= max_batch_size
+        # only a lone over-long item may exceed the budget
+        if len(b) > 1:
+            assert len(b) * max(lengths[i] for i in b) <= max_tokens
+    return batches
+
+
+def test_plan_respects_budget_on_random_lengths():
+    rng = random.Random(0)
+    for _ in range(200):
+        lengths = [rng.randint(1, 80) for _ in range(rng.randint(0, 60))]
+        max_tokens = rng.randint(1, 400)
+        max_batch_size = rng.choice([None, 1, 4, 16])
+        _check_plan(lengths, max_tokens, max_batch_size)
+
+
+def test_plan_sorts_longest_first_with_stable_ties():
+    lengths = [3, 10, 3, 7, 10]
+    batches = plan_token_batches(lengths, max_tokens=1000)
+    assert batches == [[1, 4, 3, 0, 2]]
+
+
+def test_plan_packs_greedily():
+    # 4 x 5 = 20 tokens fit, the fifth item would make 25
+    batches = plan_token_batches([5] * 6, max_tokens=20)
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_plan_gives_overlong_item_its_own_batch():
+    batches = _check_plan([50, 2, 2], max_tokens=10)
+    assert batches[0] == [0]
+
+
+def test_plan_caps_rows():
+    batches = plan_token_batches([1] * 10, max_tokens=1000, max_batch_size=3)
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+
+
+def test_plan_empty_and_invalid_budget():
+    assert plan_token_batches([], max_tokens=10) == []
+    with pytest.raises(ValueError):
+        plan_token_batches([1, 2], max_tokens=0)
+
+
+def test_dedup_roundtrip():
+    rng = random.Random(1)
+    items = [rng.choice(["a", "b", "", "c", ("x", "y")]) for _ in range(500)]
+
+    unique, inverse = dedup(items)
+
+    assert len(unique) == len(set(unique))
+    assert [unique[j] for j in inverse] == items
+    # first-seen order
+    assert unique == list(dict.fromkeys(items))
+
+
+def test_dedup_empty():
+    assert dedup([]) == ([], [])
@@ -0,0 +1,30 @@
+# tests/test_checkpoint.py -- CheckpointLog survives interrupted writes
+
+from checkpoint import CheckpointLog
+
+
+def test_roundtrip_and_later_records_win(tmp_path):
+    log = CheckpointLog(str(tmp_path / "sub" / "log.jsonl"))
+    assert log.load() == {}
+
+    log.append([("a", 1), ("b", [1, 2])])
+    log.append([("a", {"x": "ş"})])
+
+    assert log.load() == {"a": {"x": "ş"}, "b": [1, 2]}
+    log.clear()
+    assert log.load() == {}
+
+
+def test_append_after_torn_line(tmp_path):
+    path = tmp_path / "log.jsonl"
+    log = CheckpointLog(str(path))
+    log.append([("a", 1)])
+    # crash mid-write: half a record, no trailing newline
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "b", "val')
+
+    assert log.load() == {"a": 1}
+    log.append([("c", 3)])
+    log.append([("d", 4)])
+
+    assert log.load() == {"a": 1, "c": 3, "d": 4}
@@ -0,0 +1,113 @@
+# tests/test_features.py -- column-wise features must match the old per-sentence loop
+
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import (
+    FEATURE_COLS,
+    SURFACE_FEATURE_COLS,
+    build_feature_frame,
+    count_chars,
+    count_tokens,
+    surface_features,
+    type_token_ratio,
+)
+
+N_TRIPLES = 2000
+
+_WORDS = ["a", "bb", "the", "kitap", "okudum", "čaj", "Straße", "猫", "ist", "."]
+_SPACES = [" ", "  ", "\t", "\n"]
+
+
+def _sentence_features(src: str, ref: str, mt: str) -> dict:
+    """The per-sentence loop build_typology_dataset used before features.py."""
+    src_tok, ref_tok, mt_tok = count_tokens(src), count_tokens(ref), count_tokens(mt)
+    src_char, ref_char, mt_char = count_chars(src), count_chars(ref), count_chars(mt)
+    return {
+        "src_len_tokens": src_tok,
+        "ref_len_tokens": ref_tok,
+        "mt_len_tokens": mt_tok,
+        "src_len_chars": src_char,
+        "ref_len_chars": ref_char,
+        "mt_len_chars": mt_char,
+        "len_ratio_mt_src": mt_tok / src_tok if src_tok > 0 else 0.0,
+        "len_ratio_ref_src": ref_tok / src_tok if src_tok > 0 else 0.0,
+        "src_chars_per_token": src_char / src_tok if src_tok > 0 else 0.0,
+        "ref_chars_per_token": ref_char / ref_tok if ref_tok > 0 else 0.0,
+        "mt_chars_per_token": mt_char / mt_tok if mt_tok > 0 else 0.0,
+        "src_ttr": type_token_ratio(src),
+        "ref_ttr": type_token_ratio(ref),
+        "mt_ttr": type_token_ratio(mt),
+    }
+
+
+def _random_text(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.1:
+        return ""
+    if kind < 0.15:
+        return rng.choice(_SPACES)
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(1, 12))]
+    text = words[0]
+    for w in words[1:]:
+        text += rng.choice(_SPACES) + w
+    # leading / trailing whitespace sometimes
+    if rng.random() < 0.2:
+        text = rng.choice(_SPACES) + text + rng.choice(_SPACES)
+    return text
+
+
+def _random_triples(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [tuple(_random_text(rng) for _ in range(3)) for _ in range(n)]
+
+
+def test_surface_features_match_per_sentence_loop():
+    triples = _random_triples(N_TRIPLES)
+    src, ref, mt = (list(col) for col in zip(*triples))
+
+    got = surface_features(src, ref, mt)
+    expected = pd.DataFrame(
+        [_sentence_features(*t) for t in triples], columns=SURFACE_FEATURE_COLS
+    )
+
+    assert list(got.columns) == SURFACE_FEATURE_COLS
+    assert len(got) == N_TRIPLES
+    for col in SURFACE_FEATURE_COLS:
+        np.testing.assert_allclose(
+            got[col].to_numpy(dtype=float),
+            expected[col].to_numpy(dtype=float),
+            rtol=0,
+            atol=1e-12,
+            err_msg=col,
+        )
+    assert any(not s.strip() for s in src + ref + mt)  # empties were exercised
+
+
+def test_surface_features_whitespace_only():
+    got = surface_features(["", " "], ["", ""], ["", "\t"])
+    # no tokens: counts, ratios and TTR are 0, chars still count
+    token_cols = [c for c in SURFACE_FEATURE_COLS if "_len_chars" not in c]
+    assert (got[token_cols].to_numpy(dtype=float) == 0.0).all()
+    assert got["src_len_chars"].tolist() == [0, 1]
+
+
+def test_surface_features_rejects_misaligned_lists():
+    with pytest.raises(ValueError):
+        surface_features(["a"], ["b", "c"], ["d"])
+
+
+def test_build_feature_frame_columns():
+    triples = _random_triples(50, seed=1)
+    src, ref, mt = (list(col) for col in zip(*triples))
+    comet = [0.5] * len(src)
+
+    df = build_feature_frame(src, ref, mt, comet, 12.5, 40.0, 0.5)
+
+    assert list(df.columns) == FEATURE_COLS
+    assert (df["bleu_corpus"] == 12.5).all()
+    assert (df["chrf_corpus"] == 40.0).all()
+    assert (df["comet_sentence"] == 0.5).all()
@@ -0,0 +1,42 @@
+# tests/test_import_time.py -- importing the pipeline modules must not load the models
+
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds for `import metrics, build_typology_dataset` in a fresh interpreter
+# (pandas + sacrebleu dominate; loading torch/COMET would take several times this)
+IMPORT_BUDGET_SECONDS = 3.0
+
+HEAVY_MODULES = ["torch", "transformers", "comet", "fasttext"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import metrics, build_typology_dataset
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe():
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_does_not_load_models():
+    assert _probe()["loaded"] == []
+
+
+def test_import_time_budget():
+    seconds = _probe()["seconds"]
+    assert seconds < IMPORT_BUDGET_SECONDS, f"import took {seconds:.2f}s"
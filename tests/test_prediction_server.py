@@ -0,0 +1,127 @@
+# tests/test_prediction_server.py -- micro-batching HTTP server against a stub predictor
+
+import threading
+import urllib.error
+
+import pytest
+
+import mt_models
+from prediction_server import PredictionClient, PredictionService, make_server
+
+# M2M100 language ids the stub tokenizer knows
+_LANG_IDS = {"tr": 1, "cs": 2, "de": 3}
+
+
+class _StubTokenizer:
+    def get_lang_id(self, lang: str) -> int:
+        return _LANG_IDS[lang]
+
+
+class _StubTranslator:
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    def translate_mixed(self, items, **kwargs):
+        self.calls.append(list(items))
+        out = {}
+        for text, lang in items:
+            _StubTokenizer().get_lang_id(lang)  # a bad code would fail the whole call
+            out.setdefault(lang, []).append(f"{lang}:{text[::-1]}")
+        return out
+
+
+class _StubPredictor:
+    device = "cpu"
+    backend = "torch"
+    batch_size = 8
+    max_tokens = None
+    min_conf = 0.5
+
+    def __init__(self):
+        self._mt_lock = threading.Lock()
+        self._comet_lock = threading.Lock()
+        self.calls: list = []
+
+    def translator(self, lang: str):
+        return _StubTranslator(self.calls)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(mt_models, "get_m2m100", lambda *a, **k: (_StubTokenizer(), None))
+    predictor = _StubPredictor()
+    # a wide window so the concurrent requests below land in one batch
+    service = PredictionService(predictor, window_ms=500)
+    httpd = make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    client = PredictionClient(f"http://127.0.0.1:{httpd.server_address[1]}", timeout=30)
+    yield client, predictor
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _concurrent(calls):
+    """Run (fn, args) pairs at the same time; result or HTTPError per call."""
+    barrier = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def run(i, fn, args):
+        barrier.wait()
+        try:
+            results[i] = fn(*args)
+        except urllib.error.HTTPError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, fn, args)) for i, (fn, args) in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_translate_calls_share_a_batch(server):
+    client, predictor = server
+    requests = [(["hello", "world"], "tr"), (["good day"], "cs"), (["hi"], "de"), (["bye"], "tr")]
+
+    results = _concurrent([(client.translate, r) for r in requests])
+
+    for (texts, lang), got in zip(requests, results):
+        assert got == [f"{lang}:{t[::-1]}" for t in texts]
+    sizes = client.metrics()["batch_sizes"]["translate"]
+    n_items = sum(len(texts) for texts, _ in requests)
+    assert sum(len(c) for c in predictor.calls) == n_items
+    # 4 requests, fewer model calls: at least two of them were coalesced
+    assert sizes["count"] == len(predictor.calls) < len(requests)
+    assert sizes["mean"] > 2
+
+
+def test_bad_tgt_lang_is_rejected_without_failing_its_batch(server):
+    client, predictor = server
+
+    results = _concurrent([
+        (client.translate, (["hello"], "tr")),
+        (client.translate, (["hello"], "xx")),
+        (client.translate, (["world"], "cs")),
+    ])
+
+    assert results[0] == ["tr:olleh"]
+    assert results[2] == ["cs:dlrow"]
+    assert isinstance(results[1], urllib.error.HTTPError)
+    assert results[1].code == 400
+    # the bad request never reached the model
+    assert all(lang != "xx" for call in predictor.calls for _, lang in call)
+
+
+def test_latency_histograms_are_filled(server):
+    client, _ = server
+    client.translate(["a"], "tr")
+    with pytest.raises(urllib.error.HTTPError):
+        client.translate(["a"], "xx")
+
+    latency = client.metrics()["latency_ms"]
+    assert latency["translate"]["count"] == 2
+    assert latency["translate"]["mean"] > 0
+    assert sum(latency["translate"]["buckets"].values()) == 2
+    assert latency["score"]["count"] == 0
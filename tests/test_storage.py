@@ -0,0 +1,54 @@
+# tests/test_storage.py -- Parquet dataset partitions
+
+import pandas as pd
+
+from features import FEATURE_COLS
+from storage import (
+    dataset_exists,
+    dataset_langs,
+    read_dataset,
+    remove_dataset_partition,
+    write_dataset_partition,
+)
+
+
+def _partition(lang_code: str, n: int = 3) -> pd.DataFrame:
+    df = pd.DataFrame({
+        "lang": lang_code,
+        "pair": f"en-{lang_code}",
+        "typology": "fusional",
+        "src": [f"s{i}" for i in range(n)],
+        "ref": [f"r{i}" for i in range(n)],
+        "mt": [f"m{i}" for i in range(n)],
+    })
+    for col in FEATURE_COLS:
+        df[col] = 1.0
+    return df
+
+
+def test_partitions_roundtrip(tmp_path):
+    root = str(tmp_path / "typology")
+    write_dataset_partition(_partition("tr"), "tr", root=root)
+    write_dataset_partition(_partition("cs", n=2), "cs", root=root)
+
+    assert dataset_exists(root)
+    assert dataset_langs(root) == ["cs", "tr"]
+    df = read_dataset(columns=["lang", "src", "comet_corpus"], root=root)
+    assert sorted(df["lang"]) == ["cs", "cs", "tr", "tr", "tr"]
+    assert list(df.columns) == ["lang", "src", "comet_corpus"]
+
+    remove_dataset_partition("tr", root=root)
+    assert read_dataset(root=root)["lang"].unique().tolist() == ["cs"]
+
+
+def test_read_dataset_after_last_partition_removed(tmp_path):
+    root = str(tmp_path / "typology")
+    write_dataset_partition(_partition("tr"), "tr", root=root)
+    remove_dataset_partition("tr", root=root)
+
+    # corpus_metrics.parquet is still there, but no partition is
+    assert not dataset_exists(root)
+    df = read_dataset(columns=FEATURE_COLS + ["typology"], root=root)
+    assert df.empty
+    assert list(df.columns) == FEATURE_COLS + ["typology"]
+    assert read_dataset(root=root).empty
@@ -0,0 +1,89 @@
+# tests/test_work_queue.py -- several worker processes, one of which dies mid-job
+
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from work_queue import WorkQueue, init_queue, shard_ranges
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LANGS = ["tr", "cs"]
+N_ROWS = 53
+SHARD_SIZE = 5
+LEASE_SECONDS = 1.0
+POLL_SECONDS = 0.1
+
+# Worker process: argv = queue_dir, worker_id, crash ("1" = die inside the first job)
+_WORKER = """
+import os, sys, time
+import pandas as pd
+from work_queue import WorkQueue, run_worker
+
+queue_dir, worker_id, crash = sys.argv[1:4]
+queue = WorkQueue(queue_dir)
+
+def handler(payload, job_id):
+    if crash == "1":
+        open(os.path.join(queue_dir, "crashed"), "w").close()
+        time.sleep(0.2)
+        os._exit(3)  # no cleanup, no fail(): the lease just stops being renewed
+    time.sleep(0.05)
+    queue.write_frame(job_id, pd.DataFrame({"i": range(payload["start"], payload["stop"])}))
+    return {"n_rows": payload["stop"] - payload["start"]}
+
+run_worker(queue, {"shard": handler}, worker_id=worker_id,
+           lease_seconds=%r, poll_seconds=%r)
+""" % (LEASE_SECONDS, POLL_SECONDS)
+
+
+def _start_worker(queue_dir: str, worker_id: str, crash: bool = False) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", _WORKER, queue_dir, worker_id, "1" if crash else "0"],
+        cwd=REPO_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def test_workers_survive_a_crashed_worker(tmp_path):
+    queue_dir = str(tmp_path / "q")
+    queue = WorkQueue(queue_dir)
+    jobs = [
+        (f"shard-{lang}-{shard:05d}", "shard", {"lang": lang, "shard": shard, "start": start, "stop": stop})
+        for lang in LANGS
+        for shard, (start, stop) in enumerate(shard_ranges(N_ROWS, SHARD_SIZE))
+    ]
+    init_queue(queue, {"langs": LANGS}, jobs)
+
+    # The crashing worker goes first, so it is sure to hold a job when it dies
+    crasher = _start_worker(queue_dir, "w-crash", crash=True)
+    deadline = time.time() + 30
+    while not os.path.exists(os.path.join(queue_dir, "crashed")):
+        assert time.time() < deadline, "crashing worker never claimed a job"
+        time.sleep(0.02)
+    workers = [_start_worker(queue_dir, f"w-{i}") for i in range(2)]
+
+    assert crasher.wait(timeout=60) == 3
+    for w in workers:
+        _, err = w.communicate(timeout=120)
+        assert w.returncode == 0, err
+
+    assert queue.counts() == {"pending": 0, "running": 0, "done": len(jobs), "failed": 0}
+    done = queue.require_done("shard")
+    # the crashed worker's job was leased again and finished by another worker
+    retried = [j for j in done if j["attempts"] > 1]
+    assert len(retried) == 1
+    assert retried[0]["worker"] != "w-crash"
+    assert {j["worker"] for j in done} <= {"w-0", "w-1"}
+
+    for lang in LANGS:
+        merged = queue.read_shards("shard", lang)
+        pd.testing.assert_series_equal(
+            merged["i"], pd.Series(range(N_ROWS), name="i"), check_dtype=False
+        )
+    queue.close()
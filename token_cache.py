@@ -0,0 +1,150 @@
+# token_cache.py
+
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from sqlite_utils import connect_wal, select_in
+
+DEFAULT_TOKEN_CACHE_DIR = "cache/tokens"
+
+_ID_DTYPE = np.int32
+
+
+def token_key(tokenizer_id: str, text: str) -> str:
+    return hashlib.sha256(f"{tokenizer_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """
+    Persistent cache of token-id sequences, keyed by (tokenizer_id, text).
+
+    Ids of every tokenizer live back to back in one append-only int32 file
+    (<root>/<tokenizer hash>.ids) that is read through np.memmap; a SQLite
+    index maps each key to its (offset, length). Lengths can be looked up
+    without touching the ids, e.g. for batch planning.
+
+    tokenizer_id must capture everything that changes the ids: checkpoint,
+    source-language prefix, truncation length. Appends happen inside an
+    IMMEDIATE SQLite transaction, so several processes can share a cache.
+    """
+
+    def __init__(self, root: str = DEFAULT_TOKEN_CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._maps: Dict[str, np.memmap] = {}
+        self._conn = connect_wal(
+            os.path.join(root, "index.sqlite"),
+            isolation_level=None,  # explicit BEGIN / COMMIT below
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " key TEXT PRIMARY KEY,"
+            " file TEXT NOT NULL,"
+            " offset INTEGER NOT NULL,"
+            " length INTEGER NOT NULL)"
+        )
+
+    def _ids_file(self, tokenizer_id: str) -> str:
+        return hashlib.sha256(tokenizer_id.encode("utf-8")).hexdigest()[:16] + ".ids"
+
+    def _lookup(self, keys: List[str]) -> Dict[str, tuple]:
+        rows = select_in(
+            self._conn, "SELECT key, file, offset, length FROM tokens WHERE key IN ({})", keys
+        )
+        return {key: (fname, offset, length) for key, fname, offset, length in rows}
+
+    def _view(self, fname: str, end: int) -> np.ndarray:
+        """Memory map of fname covering at least `end` ids (re-mapped after growth)."""
+        mm = self._maps.get(fname)
+        if mm is None or len(mm) < end:
+            mm = np.memmap(os.path.join(self.root, fname), dtype=_ID_DTYPE, mode="r")
+            self._maps[fname] = mm
+        return mm
+
+    def lengths(self, tokenizer_id: str, texts: List[str]) -> List[Optional[int]]:
+        """Token count per text, None where the text is not cached."""
+        keys = [token_key(tokenizer_id, t) for t in texts]
+        with self._lock:
+            found = self._lookup(keys)
+        return [found[k][2] if k in found else None for k in keys]
+
+    def encode(
+        self,
+        tokenizer_id: str,
+        texts: List[str],
+        tokenize: Callable[[List[str]], List[List[int]]],
+    ) -> List[List[int]]:
+        """
+        Token ids for every text: cached ones are read from the memory map,
+        the rest go through tokenize(missing_texts) once and are appended.
+        """
+        keys = [token_key(tokenizer_id, t) for t in texts]
+        fname = self._ids_file(tokenizer_id)
+        out: List[Optional[List[int]]] = [None] * len(texts)
+
+        with self._lock:
+            found = self._lookup(keys)
+            for i, key in enumerate(keys):
+                if key in found:
+                    f, offset, length = found[key]
+                    out[i] = (
+                        self._view(f, offset + length)[offset: offset + length].tolist()
+                        if length else []
+                    )
+
+        missing = [i for i, ids in enumerate(out) if ids is None]
+        if not missing:
+            return out
+
+        # Duplicates within `texts` are tokenized and stored once
+        first: Dict[str, int] = {}
+        for i in missing:
+            first.setdefault(keys[i], i)
+        new_ids = tokenize([texts[i] for i in first.values()])
+        by_key = dict(zip(first.keys(), new_ids))
+        for i in missing:
+            out[i] = list(by_key[keys[i]])
+
+        self._append(fname, by_key)
+        return out
+
+    def _append(self, fname: str, by_key: Dict[str, List[int]]):
+        path = os.path.join(self.root, fname)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have added some keys since our lookup
+                present = self._lookup(list(by_key))
+                items = [(k, ids) for k, ids in by_key.items() if k not in present]
+                rows = []
+                with open(path, "ab") as f:
+                    offset = f.tell() // np.dtype(_ID_DTYPE).itemsize
+                    for key, ids in items:
+                        arr = np.asarray(ids, dtype=_ID_DTYPE)
+                        f.write(arr.tobytes())
+                        rows.append((key, fname, offset, len(arr)))
+                        offset += len(arr)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._conn.executemany(
+                    "INSERT INTO tokens (key, file, offset, length) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._maps.clear()
+            self._conn.close()
@@ -1,45 +1,53 @@
 # train_typology_classifier.py
 
+import argparse
+import os
+
 import pandas as pd
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import LeaveOneGroupOut, cross_val_predict, train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import make_pipeline
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, confusion_matrix
 import joblib
 
-DATA_PATH = "data/typology_training_data.csv"
+from corpus_features import AGGREGATE_COLS, AGGREGATED_SOURCE_COLS, aggregate_dataset
+from features import CORPUS_METRIC_COLS, FEATURE_COLS
+from storage import DATASET_DIR, dataset_exists, read_dataset
+
+DATA_PATH = "data/typology_training_data.csv"  # legacy CSV, used if no Parquet dataset
 MODEL_PATH = "models/typology_clf.joblib"
+CORPUS_MODEL_PATH = "models/typology_corpus_clf.joblib"
 
+LABELS = ["agglutinative", "fusional", "isolating"]
 
-def main():
+
+def _make_clf():
+    # StandardScaler + multinomial logistic regression
+    return make_pipeline(
+        StandardScaler(),
+        LogisticRegression(
+            max_iter=1000,
+            multi_class="multinomial",
+            n_jobs=-1,
+        ),
+    )
+
+
+def _load_sentence_data(columns):
+    if dataset_exists(DATASET_DIR):
+        # column-projected read: the raw src/ref/mt text is never loaded
+        print(f"[INFO] Loading data from {DATASET_DIR}/")
+        return read_dataset(columns=columns)
     print(f"[INFO] Loading data from {DATA_PATH}")
-    df = pd.read_csv(DATA_PATH)
-
-    # ---- define feature columns ----
-    feature_cols = [
-        # surface / length features
-        "src_len_tokens",
-        "ref_len_tokens",
-        "mt_len_tokens",
-        "src_len_chars",
-        "ref_len_chars",
-        "mt_len_chars",
-        "len_ratio_mt_src",
-        "len_ratio_ref_src",
-        "src_chars_per_token",
-        "ref_chars_per_token",
-        "mt_chars_per_token",
-        "src_ttr",
-        "ref_ttr",
-        "mt_ttr",
-        # sentence-level COMET
-        "comet_sentence",
-        # corpus-level metrics (same for all sentences in a language)
-        "bleu_corpus",
-        "chrf_corpus",
-        "comet_corpus",
-    ]
+    return pd.read_csv(DATA_PATH)
+
+
+def train_sentence_level():
+    # ---- feature columns: shared schema, see features.py ----
+    feature_cols = FEATURE_COLS
+
+    df = _load_sentence_data(feature_cols + ["typology"])
 
     # drop rows with missing features / labels
     df = df.dropna(subset=feature_cols + ["typology"])
@@ -59,15 +67,7 @@ def main():
 
     print(f"[INFO] Train size: {X_train.shape}, Test size: {X_test.shape}")
 
-    # ---- model: StandardScaler + multinomial logistic regression ----
-    clf = make_pipeline(
-        StandardScaler(),
-        LogisticRegression(
-            max_iter=1000,
-            multi_class="multinomial",
-            n_jobs=-1,
-        ),
-    )
+    clf = _make_clf()
 
     print("[INFO] Training classifier...")
     clf.fit(X_train, y_train)
@@ -77,16 +77,63 @@ def main():
     print("=== Classification report ===")
     print(classification_report(y_test, y_pred))
 
-    labels = ["agglutinative", "fusional", "isolating"]
     print("=== Confusion matrix (rows=true, cols=pred) ===")
-    print(confusion_matrix(y_test, y_pred, labels=labels))
+    print(confusion_matrix(y_test, y_pred, labels=LABELS))
+
+    return clf, MODEL_PATH
+
+
+def train_corpus_level(shards: int = 5):
+    """
+    One training row per language shard (see corpus_features.aggregate_dataset)
+    instead of one per sentence. Evaluated leave-one-language-out, so no
+    language is ever on both sides of a split.
+    """
+    cols = AGGREGATED_SOURCE_COLS + CORPUS_METRIC_COLS + ["lang", "typology"]
+    df = _load_sentence_data(cols)[cols]
+    df = df.dropna(subset=cols)
+
+    agg = aggregate_dataset(df, shards=shards)
+    print(f"[INFO] Aggregated {len(df)} sentences into {agg.shape[0]} corpus rows "
+          f"({agg['lang'].nunique()} languages x {shards} shards)")
+
+    X = agg[AGGREGATE_COLS]
+    y = agg["typology"]
+    groups = agg["lang"]
+
+    print("[INFO] Leave-one-language-out evaluation...")
+    y_pred = cross_val_predict(_make_clf(), X, y, groups=groups, cv=LeaveOneGroupOut())
+    print("=== Classification report ===")
+    print(classification_report(y, y_pred))
+
+    print("=== Confusion matrix (rows=true, cols=pred) ===")
+    print(confusion_matrix(y, y_pred, labels=LABELS))
+
+    print("[INFO] Training classifier on all languages...")
+    clf = _make_clf()
+    clf.fit(X, y)
+    return clf, CORPUS_MODEL_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the typology classifier.")
+    parser.add_argument("--level", choices=["sentence", "corpus"], default="sentence",
+                        help="sentence: one row per sentence (default); corpus: one row of "
+                             "aggregated features per language shard")
+    parser.add_argument("--shards", type=int, default=5,
+                        help="corpus level: aggregated rows per language")
+    args = parser.parse_args()
+
+    if args.level == "corpus":
+        clf, model_path = train_corpus_level(shards=args.shards)
+    else:
+        clf, model_path = train_sentence_level()
 
     # ---- save model ----
     os.makedirs("models", exist_ok=True)
-    joblib.dump(clf, MODEL_PATH)
-    print(f"[INFO] Saved trained classifier to {MODEL_PATH}")
+    joblib.dump(clf, model_path)
+    print(f"[INFO] Saved trained classifier to {model_path}")
 
 
 if __name__ == "__main__":
-    import os
     main()
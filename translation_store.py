@@ -0,0 +1,76 @@
+# translation_store.py
+
+import hashlib
+import json
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from sqlite_utils import connect_wal, select_in
+
+DEFAULT_STORE_PATH = "cache/translations.sqlite"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def translation_key(
+    model_name: str,
+    src_lang: str,
+    tgt_lang: str,
+    generation_config: dict,
+    text: str,
+) -> str:
+    """
+    Content address of one translation: everything that can change the
+    output (model, direction, decoding parameters) plus the source text hash.
+    """
+    payload = json.dumps(
+        [model_name, src_lang, tgt_lang, generation_config, text_hash(text)],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationStore:
+    """
+    Sentence-level translation cache backed by a single SQLite file.
+
+    Keys come from translation_key(); values are the decoded MT output.
+    Safe to share between threads, and between processes via SQLite locking.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_wal(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY,"
+            " mt TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Return {key: mt} for the keys that are present."""
+        with self._lock:
+            return dict(select_in(
+                self._conn, "SELECT key, mt FROM translations WHERE key IN ({})", keys
+            ))
+
+    def put_many(self, items: Iterable[Tuple[str, str]]):
+        """Insert (key, mt) pairs and commit."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, mt) VALUES (?, ?)",
+                list(items),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,478 @@
+# typology_predictor.py
+
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+TYPOLOGY_CLF_PATH = "models/typology_clf.joblib"
+
+# Trained with train_typology_classifier.py --level corpus (see corpus_features.py)
+TYPOLOGY_CORPUS_CLF_PATH = "models/typology_corpus_clf.joblib"
+
+
+@lru_cache(maxsize=None)
+def get_typology_clf(path: str = TYPOLOGY_CLF_PATH):
+    """
+    Load the trained typology classifier (see train_typology_classifier.py)
+    on first use and keep it for the rest of the process.
+    """
+    import joblib
+
+    return joblib.load(path)
+
+
+def bootstrap_margin(
+    frame,
+    mt: List[str],
+    ref: List[str],
+    clf,
+    confidence: float = 0.95,
+    n_boot: int = 200,
+    seed: int = 0,
+):
+    """
+    Bootstrap the classifier's averaged class probabilities over sentences.
+
+    frame holds the build_feature_frame() rows of the sentences seen so far
+    (aligned with mt / ref). Each resample draws as many sentences with
+    replacement and recomputes the corpus features from them (BLEU / chrF
+    on the drawn mt / ref, COMET as the mean of their sentence scores)
+    before predict_proba: those features dominate the classifier, so their
+    sampling noise on a short prefix has to be part of the bound.
+
+    Returns (top_idx, lower): the class with the highest mean probability on
+    frame itself and the (1 - confidence) quantile of its margin over the
+    strongest other class across resamples. lower > 0 means the top class
+    is separated at `confidence`.
+    """
+    from features import FEATURE_COLS
+    from metrics import compute_bleu, compute_chrf
+
+    n = len(frame)
+    k = len(clf.classes_)
+    top = int(np.argmax(clf.predict_proba(frame[FEATURE_COLS]).mean(axis=0)))
+    if k < 2:
+        return top, float("inf")
+
+    rng = np.random.default_rng(seed)
+    boot = np.empty((n_boot, k))
+    for b in range(n_boot):
+        idx = rng.integers(0, n, size=n)
+        sample = frame.iloc[idx].reset_index(drop=True)
+        sample["bleu_corpus"] = compute_bleu([mt[i] for i in idx], [ref[i] for i in idx])
+        sample["chrf_corpus"] = compute_chrf([mt[i] for i in idx], [ref[i] for i in idx])
+        sample["comet_corpus"] = float(sample["comet_sentence"].mean())
+        boot[b] = clf.predict_proba(sample[FEATURE_COLS]).mean(axis=0)
+    others = np.delete(boot, top, axis=1).max(axis=1)
+    margins = boot[:, top] - others
+    return top, float(np.quantile(margins, 1.0 - confidence))
+
+
+def predict_typology_sequential(
+    en_texts: List[str],
+    unk_texts: List[str],
+    translator,
+    clf=None,
+    confidence: float = 0.95,
+    start_size: int = 32,
+    growth: float = 2.0,
+    max_sentences: Optional[int] = None,
+    n_boot: int = 200,
+    seed: int = 42,
+    batch_size: int = 32,
+    max_tokens: Optional[int] = None,
+    comet_kwargs: Optional[Dict] = None,
+) -> Dict[str, object]:
+    """
+    Predict a mystery corpus' typology from as few sentences as needed.
+
+    Sentences are visited in a seeded random order, in chunks of start_size,
+    start_size * growth, ... After each chunk only the new sentences are
+    translated and COMET-scored; BLEU/chrF/COMET corpus features are
+    recomputed on everything seen so far and the classifier's averaged
+    predict_proba is updated. We stop as soon as bootstrap_margin() says the
+    top class is separated at `confidence` (or the corpus / max_sentences
+    is exhausted).
+
+    Returns the prediction plus "n_used" (sentences translated and scored),
+    "n_total", "stopped_early", the averaged "probs" and the prefix metrics.
+    """
+    from features import FEATURE_COLS, build_feature_frame
+    from metrics import compute_bleu, compute_chrf, score_comet
+
+    if len(en_texts) != len(unk_texts):
+        raise ValueError(f"en/unk lengths differ: {len(en_texts)}/{len(unk_texts)}")
+    if clf is None:
+        clf = get_typology_clf()
+    comet_kwargs = dict(comet_kwargs or {})
+
+    n_total = len(en_texts)
+    limit = n_total if max_sentences is None else min(n_total, max_sentences)
+    order = np.random.default_rng(seed).permutation(n_total)[:limit]
+
+    src: List[str] = []
+    ref: List[str] = []
+    mt: List[str] = []
+    comet_scores: List[float] = []
+    chunk = max(1, start_size)
+    top, lower, avg_probs, metrics = 0, float("-inf"), None, {}
+
+    while len(src) < limit:
+        new = order[len(src): len(src) + chunk]
+        new_src = [en_texts[i] for i in new]
+        new_ref = [unk_texts[i] for i in new]
+        new_mt = translator.translate_batch(new_src, batch_size=batch_size, max_tokens=max_tokens)
+        comet_scores.extend(score_comet(new_src, new_mt, new_ref, **comet_kwargs)["scores"])
+        src.extend(new_src)
+        ref.extend(new_ref)
+        mt.extend(new_mt)
+        chunk = int(np.ceil(chunk * growth))
+
+        metrics = {
+            "bleu": compute_bleu(mt, ref),
+            "chrf": compute_chrf(mt, ref),
+            "comet": float(np.mean(comet_scores)),
+        }
+        frame = build_feature_frame(
+            src, ref, mt, comet_scores, metrics["bleu"], metrics["chrf"], metrics["comet"]
+        )
+        probs = clf.predict_proba(frame[FEATURE_COLS])
+        avg_probs = probs.mean(axis=0)
+        top, lower = bootstrap_margin(
+            frame, mt, ref, clf, confidence=confidence, n_boot=n_boot, seed=seed
+        )
+        print(
+            f"[INFO] {len(src)}/{n_total} sentences: {clf.classes_[top]} "
+            f"(p={avg_probs[top]:.3f}, margin lower bound={lower:.3f})"
+        )
+        if lower > 0:
+            break
+
+    return {
+        "typology": str(clf.classes_[top]) if avg_probs is not None else None,
+        "probs": {} if avg_probs is None else {
+            str(c): float(p) for c, p in zip(clf.classes_, avg_probs)
+        },
+        "margin_lower": lower,
+        "confidence": confidence,
+        "n_used": len(src),
+        "n_total": n_total,
+        "stopped_early": len(src) < n_total,
+        **metrics,
+    }
+
+
+def load_corpus(path: str):
+    """Read a mystery corpus CSV (columns 'en', 'unk'); returns (en_texts, unk_texts)."""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    df = df.dropna(subset=["en", "unk"])
+    return df["en"].astype(str).tolist(), df["unk"].astype(str).tolist()
+
+
+def resolve_corpus_paths(specs: List[str]) -> List[str]:
+    """Expand directories (-> their *.csv) and glob patterns, sorted and de-duplicated."""
+    import glob
+    import os
+
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths.extend(glob.glob(os.path.join(spec, "*.csv")))
+        else:
+            paths.extend(glob.glob(spec) or [spec])
+    return sorted(set(paths))
+
+
+class TypologyPredictor:
+    """
+    LID -> MT -> COMET -> features -> classifier for mystery corpora, with
+    every model loaded once and reused across corpora.
+
+    M2M100 is shared by all target languages (see mt_models.get_m2m100),
+    so one translator view per detected language is all that is created
+    per corpus. predict_many() runs several corpora on a thread pool; the
+    MT and COMET stages each hold a lock, so corpora overlap stage-wise
+    (one translating while another is scored or classified) without two
+    threads driving the same model at once.
+    """
+
+    def __init__(
+        self,
+        clf_path: Optional[str] = None,
+        device: str = "cpu",
+        backend: str = "torch",
+        store=None,
+        use_gpu: Optional[bool] = None,
+        batch_size: int = 32,
+        max_tokens: Optional[int] = None,
+        comet_batch_size: int = 16,
+        min_conf: float = 0.7,
+        level: str = "sentence",
+    ):
+        """
+        level: "sentence" -- per-sentence classifier, probabilities averaged
+               "corpus"   -- one prediction from the corpus' aggregated
+                             features (corpus_features.CorpusAggregator)
+        clf_path defaults to the classifier trained for `level`.
+        """
+        import threading
+
+        import torch
+
+        from lid import get_lid_model
+        from metrics import get_comet_model
+        from mt_models import DEFAULT_MAX_TOKENS, DEFAULT_MODEL_NAME, get_m2m100
+
+        self.device = device
+        self.backend = backend
+        self.store = store
+        self.use_gpu = torch.cuda.is_available() if use_gpu is None else use_gpu
+        self.batch_size = batch_size
+        self.max_tokens = DEFAULT_MAX_TOKENS if max_tokens is None else max_tokens
+        self.comet_batch_size = comet_batch_size
+        self.min_conf = min_conf
+        if level not in ("sentence", "corpus"):
+            raise ValueError(f"Unknown level {level!r} (expected 'sentence' or 'corpus')")
+        self.level = level
+        if clf_path is None:
+            clf_path = TYPOLOGY_CORPUS_CLF_PATH if level == "corpus" else TYPOLOGY_CLF_PATH
+
+        start = time.perf_counter()
+        self.clf = get_typology_clf(clf_path)
+        get_lid_model()
+        get_m2m100(DEFAULT_MODEL_NAME, device, backend)
+        get_comet_model()
+        self.load_seconds = time.perf_counter() - start
+        print(f"[INFO] TypologyPredictor models loaded in {self.load_seconds:.1f}s")
+
+        self._translators: Dict[str, object] = {}
+        self._translators_lock = threading.Lock()
+        self._mt_lock = threading.Lock()
+        self._comet_lock = threading.Lock()
+
+    def translator(self, tgt_lang: str):
+        from mt_models import MTTranslator
+
+        with self._translators_lock:
+            if tgt_lang not in self._translators:
+                self._translators[tgt_lang] = MTTranslator(
+                    f"en-{tgt_lang}", device=self.device, store=self.store, backend=self.backend
+                )
+            return self._translators[tgt_lang]
+
+    def predict(
+        self,
+        en_texts: List[str],
+        unk_texts: List[str],
+        name: Optional[str] = None,
+        early_exit: bool = False,
+        confidence: float = 0.95,
+        start_size: int = 32,
+    ) -> Dict[str, object]:
+        """
+        Predict the typology of one corpus. Returns a flat result row:
+        typology (averaged probabilities), typology_majority (sentence
+        vote), prob_<class>, LID stats, BLEU/chrF/COMET, sentences used
+        and per-stage seconds.
+
+        early_exit=True uses predict_typology_sequential(); its MT and COMET
+        work is then reported together under seconds_mt_comet.
+        """
+        from lid import majority_lang
+        from metrics import score_comet
+
+        if early_exit and self.level != "sentence":
+            raise ValueError("early_exit needs the sentence-level classifier.")
+
+        row: Dict[str, object] = {"corpus": name, "n_sentences": len(en_texts)}
+        timings: Dict[str, float] = {}
+
+        start = time.perf_counter()
+        lid_info = majority_lang(unk_texts, min_conf=self.min_conf)
+        timings["seconds_lid"] = time.perf_counter() - start
+        row.update({
+            "lid_lang": lid_info["ft_lang"],
+            "lid_n_high_conf": lid_info["n_high_conf"],
+            "lid_avg_conf": lid_info["avg_conf"],
+            "lid_dist": lid_info["dist"],
+        })
+        translator = self.translator(lid_info["ft_lang"])
+
+        if early_exit:
+            start = time.perf_counter()
+            with self._mt_lock, self._comet_lock:
+                result = predict_typology_sequential(
+                    en_texts,
+                    unk_texts,
+                    translator,
+                    clf=self.clf,
+                    confidence=confidence,
+                    start_size=start_size,
+                    batch_size=self.batch_size,
+                    max_tokens=self.max_tokens,
+                    comet_kwargs={"batch_size": self.comet_batch_size, "use_gpu": self.use_gpu},
+                )
+            timings["seconds_mt_comet"] = time.perf_counter() - start
+            row.update({
+                "typology": result["typology"],
+                "n_used": result["n_used"],
+                "bleu": result["bleu"],
+                "chrf": result["chrf"],
+                "comet": result["comet"],
+            })
+            row.update({f"prob_{c}": p for c, p in result["probs"].items()})
+            row.update(timings)
+            return row
+
+        start = time.perf_counter()
+        with self._mt_lock:
+            mt_texts = translator.translate_batch(
+                en_texts, batch_size=self.batch_size, max_tokens=self.max_tokens
+            )
+        timings["seconds_mt"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with self._comet_lock:
+            comet_scores = score_comet(
+                en_texts, mt_texts, unk_texts,
+                batch_size=self.comet_batch_size, use_gpu=self.use_gpu,
+            )["scores"]
+        timings["seconds_comet"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        row.update(self.classify(en_texts, unk_texts, mt_texts, comet_scores))
+        timings["seconds_classify"] = time.perf_counter() - start
+
+        row.update(timings)
+        return row
+
+    def classify(
+        self,
+        en_texts: List[str],
+        unk_texts: List[str],
+        mt_texts: List[str],
+        comet_scores: List[float],
+    ) -> Dict[str, object]:
+        """
+        Corpus metrics, features and classifier output for an already
+        translated and COMET-scored corpus (the last stage of predict()).
+        """
+        from features import FEATURE_COLS, build_feature_frame
+        from metrics import compute_bleu, compute_chrf
+
+        bleu = compute_bleu(mt_texts, unk_texts)
+        chrf = compute_chrf(mt_texts, unk_texts)
+        comet = float(np.mean(comet_scores)) if len(comet_scores) else float("nan")
+        frame = build_feature_frame(
+            en_texts, unk_texts, mt_texts, comet_scores, bleu, chrf, comet
+        )
+
+        result: Dict[str, object] = {}
+        if self.level == "corpus":
+            from corpus_features import CorpusAggregator
+
+            agg = CorpusAggregator().update(frame, bleu_corpus=bleu, chrf_corpus=chrf)
+            avg_probs = self.clf.predict_proba(agg.frame())[0]
+        else:
+            X = frame[FEATURE_COLS]
+            y_pred = self.clf.predict(X)
+            avg_probs = self.clf.predict_proba(X).mean(axis=0)
+            values, counts = np.unique(y_pred, return_counts=True)
+            result["typology_majority"] = str(values[int(np.argmax(counts))])
+
+        result.update({
+            "typology": str(self.clf.classes_[int(np.argmax(avg_probs))]),
+            "n_used": len(en_texts),
+            "bleu": bleu,
+            "chrf": chrf,
+            "comet": comet,
+        })
+        result.update({f"prob_{c}": float(p) for c, p in zip(self.clf.classes_, avg_probs)})
+        return result
+
+    def predict_file(self, path: str, **kwargs) -> Dict[str, object]:
+        start = time.perf_counter()
+        en_texts, unk_texts = load_corpus(path)
+        row = self.predict(en_texts, unk_texts, name=path, **kwargs)
+        row["seconds_total"] = time.perf_counter() - start
+        return row
+
+    def predict_many(self, paths: List[str], workers: int = 2, **kwargs) -> List[Dict[str, object]]:
+        """predict_file() for every path on `workers` threads; rows come back in paths order."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def run(path):
+            try:
+                return self.predict_file(path, **kwargs)
+            except Exception as e:  # one bad corpus should not sink the batch
+                print(f"[WARN] {path}: {e}")
+                return {"corpus": path, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(run, paths))
+
+
+def write_results(rows: List[Dict[str, object]], out_path: str):
+    """Write result rows as JSON lines (*.jsonl / *.json) or CSV (anything else)."""
+    import json
+    import os
+
+    import pandas as pd
+
+    dirname = os.path.dirname(out_path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+
+    if out_path.endswith((".jsonl", ".json")):
+        with open(out_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    else:
+        df = pd.DataFrame(rows)
+        if "lid_dist" in df.columns:
+            df["lid_dist"] = df["lid_dist"].map(
+                lambda d: json.dumps(d) if isinstance(d, dict) else d
+            )
+        df.to_csv(out_path, index=False)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Predict the typology of many mystery corpora with one model load."
+    )
+    parser.add_argument("corpora", nargs="+",
+                        help="CSV files (columns 'en', 'unk'), directories or glob patterns")
+    parser.add_argument("--out", default="output/typology_predictions.csv",
+                        help="*.csv, or *.jsonl for one JSON object per corpus")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="corpora processed concurrently")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--early-exit", action="store_true")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--level", choices=["sentence", "corpus"], default="sentence",
+                        help="classifier granularity, see train_typology_classifier.py --level")
+    args = parser.parse_args()
+
+    paths = resolve_corpus_paths(args.corpora)
+    if not paths:
+        parser.error("no corpora matched")
+
+    predictor = TypologyPredictor(device=args.device, level=args.level)
+    rows = predictor.predict_many(
+        paths, workers=args.workers, early_exit=args.early_exit, confidence=args.confidence
+    )
+    for row in rows:
+        print(f"{row['corpus']}: {row.get('typology', 'ERROR')}")
+
+    write_results(rows, args.out)
+    print(f"[INFO] Saved {len(rows)} predictions to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
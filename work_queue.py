@@ -0,0 +1,376 @@
+# work_queue.py -- SQLite job queue on a shared directory, for multi-node runs
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_LEASE_SECONDS = 600.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+# How long an idle worker waits before looking for expired leases again
+DEFAULT_POLL_SECONDS = 10.0
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shard_ranges(n: int, shard_size: int) -> List[Tuple[int, int]]:
+    """[start, stop) row ranges of consecutive shards covering n rows."""
+    return [(start, min(start + shard_size, n)) for start in range(0, n, shard_size)]
+
+
+class WorkQueue:
+    """
+    Persistent job queue in <queue_dir>/queue.sqlite, shared by any number of
+    worker processes on any number of nodes that mount queue_dir.
+
+    A job is (job_id, kind, payload); payload is JSON and carries everything
+    a worker needs to run it. claim() hands a job out under a lease of
+    lease_seconds, which the worker renews with heartbeat() while it runs.
+    A job whose lease ran out (its worker died or hung) is handed out again;
+    after max_attempts claims, or failures, it is marked failed. Results are
+    small JSON values; bulky outputs go to result_dir (see write_frame).
+
+    Claims run in IMMEDIATE transactions, so two workers never get the same
+    live job. The database uses SQLite's rollback journal rather than WAL,
+    which needs shared memory on one host; on NFS-like filesystems the
+    mount must support POSIX locks. Leases compare wall clocks, so nodes
+    need roughly synchronised clocks (NTP) relative to lease_seconds.
+    """
+
+    def __init__(self, queue_dir: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.queue_dir = queue_dir
+        self.result_dir = os.path.join(queue_dir, "results")
+        self.max_attempts = max_attempts
+        os.makedirs(self.result_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(queue_dir, "queue.sqlite"),
+            timeout=120,
+            check_same_thread=False,
+            isolation_level=None,  # explicit BEGIN / COMMIT below
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'pending',"  # pending / running / done / failed
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " result TEXT,"
+            " error TEXT,"
+            " updated REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL)"
+        )
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return out
+
+    # ---------- setup ----------
+
+    def set_meta(self, key: str, value: object):
+        """Store a JSON value (e.g. the run configuration) next to the jobs."""
+        self._transaction(lambda: self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))
+        ))
+
+    def get_meta(self, key: str, default: object = None) -> object:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def add_jobs(self, jobs: List[Tuple[str, str, dict]]) -> int:
+        """
+        Enqueue (job_id, kind, payload) triples. Existing job ids are left
+        untouched (finished ones stay finished), so re-running the same
+        init is harmless. Returns the number of new jobs.
+        """
+        now = time.time()
+
+        def insert():
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (job_id, kind, payload, updated) VALUES (?, ?, ?, ?)",
+                [(job_id, kind, json.dumps(payload, sort_keys=True), now)
+                 for job_id, kind, payload in jobs],
+            )
+            return self._conn.total_changes - before
+
+        return self._transaction(insert)
+
+    def retry_failed(self) -> int:
+        """Put failed jobs back to pending with a fresh attempt budget."""
+        def reset():
+            return self._conn.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, worker = NULL,"
+                " lease_until = NULL, updated = ? WHERE state = 'failed'",
+                (time.time(),),
+            ).rowcount
+
+        return self._transaction(reset)
+
+    # ---------- worker side ----------
+
+    def claim(
+        self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> Optional[Tuple[str, str, dict]]:
+        """
+        Lease the next job (lowest job_id first): a pending one, or a running
+        one whose lease expired. Returns (job_id, kind, payload) or None.
+        """
+        def take():
+            now = time.time()
+            # Dead workers' jobs that are out of attempts are given up on
+            self._conn.execute(
+                "UPDATE jobs SET state = 'failed', updated = ?,"
+                " error = COALESCE(error, 'lease expired')"
+                " WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = self._conn.execute(
+                "SELECT job_id, kind, payload FROM jobs"
+                " WHERE state = 'pending' OR (state = 'running' AND lease_until < ?)"
+                " ORDER BY job_id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, worker = ?,"
+                " lease_until = ?, updated = ? WHERE job_id = ?",
+                (worker_id, now + lease_seconds, now, row[0]),
+            )
+            return row[0], row[1], json.loads(row[2])
+
+        return self._transaction(take)
+
+    def heartbeat(
+        self, job_id: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> bool:
+        """Extend the lease; False if the job is no longer this worker's."""
+        def renew():
+            now = time.time()
+            return self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ?"
+                " WHERE job_id = ? AND worker = ? AND state = 'running'",
+                (now + lease_seconds, now, job_id, worker_id),
+            ).rowcount > 0
+
+        return self._transaction(renew)
+
+    def complete(self, job_id: str, worker_id: str, result: object = None) -> bool:
+        """
+        Mark a job done. A worker that lost its lease may still finish; jobs
+        are deterministic, so the first result to arrive is kept.
+        """
+        def finish():
+            return self._conn.execute(
+                "UPDATE jobs SET state = 'done', result = ?, error = NULL, worker = ?,"
+                " lease_until = NULL, updated = ? WHERE job_id = ? AND state != 'done'",
+                (json.dumps(result), worker_id, time.time(), job_id),
+            ).rowcount > 0
+
+        return self._transaction(finish)
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """Record a failure; the job is retried until it has used max_attempts."""
+        self._transaction(lambda: self._conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " error = ?, lease_until = NULL, updated = ?"
+            " WHERE job_id = ? AND worker = ? AND state = 'running'",
+            (self.max_attempts, error, time.time(), job_id, worker_id),
+        ))
+
+    # ---------- inspection ----------
+
+    def counts(self) -> Dict[str, int]:
+        """{state: number of jobs}, every state included."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        out = {state: 0 for state in ("pending", "running", "done", "failed")}
+        out.update(rows)
+        return out
+
+    def unfinished(self) -> int:
+        """Jobs that are pending or running (live or with an expired lease)."""
+        c = self.counts()
+        return c["pending"] + c["running"]
+
+    def jobs(self, kind: Optional[str] = None) -> List[Dict[str, object]]:
+        """Every job as a dict, ordered by job_id."""
+        query = (
+            "SELECT job_id, kind, payload, state, attempts, worker, lease_until, result, error"
+            " FROM jobs"
+        )
+        params: tuple = ()
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY job_id", params).fetchall()
+        return [
+            {
+                "job_id": job_id,
+                "kind": k,
+                "payload": json.loads(payload),
+                "state": state,
+                "attempts": attempts,
+                "worker": worker,
+                "lease_until": lease_until,
+                "result": json.loads(result) if result is not None else None,
+                "error": error,
+            }
+            for job_id, k, payload, state, attempts, worker, lease_until, result, error in rows
+        ]
+
+    def require_done(self, kind: str) -> List[Dict[str, object]]:
+        """jobs(kind), or RuntimeError if any of them is not done yet."""
+        jobs = self.jobs(kind)
+        unfinished = [j["job_id"] for j in jobs if j["state"] != "done"]
+        if unfinished:
+            raise RuntimeError(
+                f"{len(unfinished)} job(s) in {self.queue_dir} are not done "
+                f"(e.g. {unfinished[0]}); see --role status."
+            )
+        return jobs
+
+    def read_shards(self, kind: str, lang: str) -> pd.DataFrame:
+        """
+        The write_frame() outputs of lang's `kind` jobs, concatenated in
+        job_id order: with zero-padded shard numbers in the ids that is
+        shard order, whichever worker ran them.
+        """
+        parts = [
+            pd.read_parquet(self.result_path(j["job_id"]))
+            for j in self.jobs(kind) if j["payload"]["lang"] == lang
+        ]
+        return pd.concat(parts, ignore_index=True)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- shard outputs ----------
+
+    def result_path(self, job_id: str, suffix: str = ".parquet") -> str:
+        return os.path.join(self.result_dir, job_id + suffix)
+
+    def write_frame(self, job_id: str, df: pd.DataFrame) -> str:
+        """Write a job's output table under result_dir atomically; returns its path."""
+        path = self.result_path(job_id)
+        # Per-process tmp name: a re-leased job may briefly run twice
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        return path
+
+
+def init_queue(queue: WorkQueue, config: dict, jobs: List[Tuple[str, str, dict]]) -> int:
+    """
+    Record the run configuration and enqueue its jobs. Re-running init on
+    the same queue adds nothing new and gives failed jobs another round;
+    a queue created for a different configuration is refused.
+    """
+    config = json.loads(json.dumps(config))
+    existing = queue.get_meta("config")
+    if existing is not None and existing != config:
+        raise ValueError(
+            f"{queue.queue_dir} already holds a run with config {existing}; "
+            f"use another queue directory."
+        )
+    queue.set_meta("config", config)
+    n_new = queue.add_jobs(jobs)
+    n_retry = queue.retry_failed()
+    print(f"[INFO] {queue.queue_dir}: {n_new} new job(s), {n_retry} failed job(s) re-queued")
+    return n_new
+
+
+def run_worker(
+    queue: WorkQueue,
+    handlers: Dict[str, Callable[[dict, str], object]],
+    worker_id: Optional[str] = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    poll_seconds: float = DEFAULT_POLL_SECONDS,
+) -> int:
+    """
+    Claim and run jobs until none are left; returns how many this worker finished.
+
+    handlers maps a job kind to fn(payload, job_id) -> JSON-able result.
+    While a job runs, a background thread renews its lease every
+    lease_seconds / 3. A handler exception is recorded with fail() and the
+    worker moves on. When nothing is claimable but other workers still hold
+    leases, the worker waits poll_seconds and looks again, so it can take
+    over jobs of workers that die.
+    """
+    worker_id = worker_id or default_worker_id()
+    n_done = 0
+    while True:
+        job = queue.claim(worker_id, lease_seconds)
+        if job is None:
+            if queue.unfinished() == 0:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        job_id, kind, payload = job
+        print(f"[INFO] {worker_id} running {job_id}")
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(lease_seconds / 3):
+                if not queue.heartbeat(job_id, worker_id, lease_seconds):
+                    print(f"[WARN] {worker_id} lost the lease on {job_id}")
+                    return
+
+        beater = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+        beater.start()
+        try:
+            if kind not in handlers:
+                raise ValueError(f"No handler for job kind {kind!r}")
+            result = handlers[kind](payload, job_id)
+        except Exception:
+            error = traceback.format_exc()
+            print(f"[WARN] {job_id} failed on {worker_id}:\n{error}")
+            queue.fail(job_id, worker_id, error)
+            continue
+        finally:
+            stop.set()
+            beater.join()
+
+        queue.complete(job_id, worker_id, result)
+        n_done += 1
+
+    print(f"[INFO] {worker_id}: queue drained, finished {n_done} job(s)")
+    return n_done
+
+
+def print_status(queue: WorkQueue):
+    counts = queue.counts()
+    print(f"[INFO] {queue.queue_dir}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    for job in queue.jobs():
+        if job["state"] == "failed":
+            last = (job["error"] or "").strip().splitlines()[-1:] or [""]
+            print(f"[WARN] {job['job_id']} failed after {job['attempts']} attempt(s): {last[0]}")